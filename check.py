@@ -4,6 +4,9 @@ UNIVERSAL FORENSIC INTEGRITY ANALYZER (HYBRID MEMORY/DISK)
 Chức năng:
   - Hỗ trợ input là Đường dẫn file (cho Quét Sâu) HOẶC Bytes thô (cho Quét Nhanh).
   - Giữ nguyên toàn bộ logic phân tích Visual/Structure/Office/PDF mạnh nhất.
+  - Chế độ lấy mẫu (analyze_sampled_integrity): chỉ đọc header, footer và K khối cách đều
+    -> file lớn vẫn được chấm với chi phí I/O cố định. Video / archive (mp4, mov, avi, mkv, zip, rar, 7z)
+    chỉ được chấm ở chế độ này: kiểm cấu trúc container + khối bị xóa trắng + entropy (không giải mã nội dung).
 """
 
 import os
@@ -219,7 +222,251 @@ def analyze_file_integrity(source, ext=None):
 check_file = analyze_file_integrity
 
 # ==========================================
-# 6. CLI
+# 6. SAMPLED ANALYSIS (ĐỌC GIỚI HẠN: ĐẦU + CUỐI + K KHỐI)
+# ==========================================
+# Ngân sách lấy mẫu cho mỗi lần quét: {"window": số byte mỗi cửa sổ, "blocks": số khối ở giữa file,
+# "full": ngưỡng đọc nguyên file cho loại có phân tích đầy đủ}.
+# File nhỏ hơn tổng ngân sách -> đọc nguyên file (phân tích đầy đủ như cũ).
+# Ảnh / Office / PDF nhỏ hơn "full" cũng đọc nguyên file: Pillow decode (analyze_visual_pixel) và testzip
+# bắt được vùng bị ghi đè bằng dữ liệu khác, điều mà mẫu header/footer không thấy.
+# budget = None -> luôn đọc nguyên file.
+SAMPLE_WINDOW = 64 * 1024
+SAMPLE_BLOCKS = 8
+FULL_READ_MAX = 50 * 1024 * 1024
+FULL_READ_EXTS = ('png', 'jpg', 'jpeg', 'webp', 'docx', 'xlsx', 'pptx', 'odt', 'ods', 'odp', 'pdf')
+DEFAULT_BUDGET = {"window": SAMPLE_WINDOW, "blocks": SAMPLE_BLOCKS, "full": FULL_READ_MAX}
+# Handle ổ đĩa thô trên Windows chỉ đọc được tại offset / độ dài là bội số sector (512 hoặc 4Kn)
+SAMPLE_ALIGN = 4096
+
+def make_budget(window_kb=SAMPLE_WINDOW // 1024, blocks=SAMPLE_BLOCKS, full_mb=FULL_READ_MAX // (1024 * 1024)):
+    """window_kb = 0 -> None (đọc nguyên file). full_mb = 0 -> mọi loại file lớn đều lấy mẫu."""
+    if window_kb <= 0:
+        return None
+    return {"window": window_kb * 1024, "blocks": max(0, blocks), "full": max(0, full_mb) * 1024 * 1024}
+
+def sample_windows(size, budget=DEFAULT_BUDGET, ext=None):
+    """Các đoạn (offset tương đối, độ dài) cần đọc: header, K khối cách đều, footer."""
+    if size <= 0:
+        return []
+    if budget is None:
+        return [(0, size)]
+    win, blocks = budget["window"], budget["blocks"]
+    if size <= win * (blocks + 2):
+        return [(0, size)]
+    if ext and ext.lower().replace(".", "") in FULL_READ_EXTS and size <= budget.get("full", 0):
+        return [(0, size)] # Dưới ngưỡng: phân tích đầy đủ như trước khi có lấy mẫu
+    windows = [(0, win)]
+    span = size - 2 * win
+    for i in range(blocks):
+        windows.append((win + span * (2 * i + 1) // (2 * blocks) - win // 2, win))
+    windows.append((size - win, win))
+    return windows
+
+def align_range(offset, size, align=SAMPLE_ALIGN):
+    """(start, end) bao trọn [offset, offset + size), làm tròn ra biên sector."""
+    return offset // align * align, -(-(offset + size) // align) * align
+
+def read_aligned(read_at, offset, size, align=SAMPLE_ALIGN):
+    """Đọc đoạn đã làm tròn ra biên sector rồi cắt lại đúng [offset, offset + size)."""
+    start, end = align_range(offset, size, align)
+    data = read_at(start, end - start)
+    return data[offset - start:offset - start + size]
+
+def read_sample(read_at, offset, size, budget=DEFAULT_BUDGET, ext=None):
+    """read_at(offset, size) -> bytes (vd. ImageReader.read_at). Trả về mẫu dùng cho analyze_sample_integrity."""
+    return {"size": size,
+            "windows": [(rel, read_aligned(read_at, offset + rel, n)) for rel, n in sample_windows(size, budget, ext)]}
+
+def is_dead_block(block):
+    # Khối chỉ gồm một giá trị byte (thường 0x00 / 0xFF): vùng đã bị xóa trắng / ghi đè
+    return not block or block.count(block[:1]) == len(block)
+
+def analyze_sampled_image(head, tail, size, img_type):
+    """Phần cấu trúc của analyze_image_structure chỉ dựa trên header/footer + kích thước thật."""
+    raw_damage = 0
+    if img_type == "PNG":
+        if not head.startswith(PNG_SIGNATURE): return 100.0
+        if b'IEND' not in tail[-20:]: raw_damage += 1024
+    elif img_type == "JPEG":
+        if not head.startswith(JPEG_SOI): return 100.0
+        if not tail.rstrip(b'\x00').endswith(b'\xff\xd9'): raw_damage += 1024
+    elif img_type == "WEBP":
+        if not (head.startswith(WEBP_RIFF) and head[8:12] == WEBP_WEBP): return 100.0
+        riff_len = struct.unpack("<I", head[4:8])[0]
+        if riff_len + 8 > size:
+            raw_damage += (riff_len + 8) - size + 1024
+    return min(100.0, raw_damage / size * 100.0)
+
+def analyze_sampled_office(head, tail, size, dead_pct):
+    if not head.startswith(b"PK\x03\x04"): return 0.0
+    # End Of Central Directory nằm ở cuối file zip
+    eocd = tail.rfind(b"PK\x05\x06")
+    if eocd < 0 or eocd + 22 > len(tail): return 0.0
+    cd_size, cd_offset = struct.unpack("<II", tail[eocd + 12:eocd + 20])
+    if cd_offset + cd_size > size: return 50.0
+    if dead_pct > 0: return 50.0 # Có khối dữ liệu bị xóa trắng -> testzip sẽ lỗi
+    cd_start = cd_offset - (size - len(tail))
+    if cd_start >= 0:
+        central_dir = tail[cd_start:eocd]
+        if b'[Content_Types].xml' not in central_dir and b'_rels/.rels' not in central_dir:
+            return 20.0
+    return 100.0
+
+def analyze_sampled_pdf(head, tail, joined):
+    if not head.startswith(b"%PDF-"): return 0.0
+    ent, zero_ratio = calculate_entropy_and_zeros(joined)
+    score = 100.0
+    if b'%%EOF' not in tail[-1024:]: score -= 20.0
+    if zero_ratio > 10.0: score -= zero_ratio
+    if ent < 4.0: score = 0.0
+    return max(0.0, score)
+
+# --- Video / archive: kiểm cấu trúc container trên header/footer ---
+CONTAINER_EXTS = {
+    "mp4": "MP4", "m4v": "MP4", "m4a": "MP4", "mov": "MP4", "3gp": "MP4",
+    "avi": "AVI", "mkv": "MKV", "webm": "MKV",
+    "zip": "ZIP", "rar": "RAR", "7z": "7Z",
+}
+MP4_FIRST_BOXES = (b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot", b"styp")
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+MKV_SEGMENT = b"\x18\x53\x80\x67"
+RAR_MAGIC = b"Rar!\x1a\x07"
+RAR_END_BLOCKS = (b"\xc4\x3d\x7b\x00\x40\x07\x00", b"\x1d\x77\x56\x51\x03\x05\x04\x00") # RAR4 / RAR5
+SEVENZIP_MAGIC = b"7z\xbc\xaf\x27\x1c"
+
+def sampled_at(head, tail, size, pos, n):
+    """n byte tại offset pos nếu nằm trọn trong header hoặc footer đã đọc, ngược lại None."""
+    tail_start = size - len(tail)
+    if pos + n <= len(head):
+        return head[pos:pos + n]
+    if pos >= tail_start and pos + n <= size:
+        return tail[pos - tail_start:pos - tail_start + n]
+    return None
+
+def truncated_damage(expected, size):
+    # Cấu trúc khai báo dài hơn file thực -> phần thiếu tính là hư hỏng
+    return min(100.0, (expected - size) * 100.0 / expected)
+
+def sampled_mp4_damage(head, tail, size):
+    """Đi theo chuỗi box cấp cao nhất: trong header, rồi sang footer nếu box nhảy tới đó."""
+    if head[4:8] not in MP4_FIRST_BOXES: return 100.0
+    pos, seen = 0, set()
+    while pos < size:
+        hdr = sampled_at(head, tail, size, pos, 16) or sampled_at(head, tail, size, pos, 8)
+        if hdr is None: return 0.0 # Box rơi vào vùng không lấy mẫu -> không kiểm tiếp được
+        box_size, box_type = struct.unpack(">I4s", hdr[:8])
+        if not all(32 <= b < 127 for b in box_type): return 50.0 # Chuỗi box bị ghi đè
+        if box_size == 1 and len(hdr) == 16:
+            box_size = struct.unpack(">Q", hdr[8:16])[0]
+        elif box_size == 0:
+            box_size = size - pos # Box cuối kéo tới hết file
+        if box_size < 8: return 50.0
+        seen.add(box_type)
+        pos += box_size
+    if pos > size: return truncated_damage(pos, size)
+    if b"moov" not in seen and b"moof" not in seen: return 50.0 # Đủ box nhưng mất moov -> không phát được
+    return 0.0
+
+def sampled_avi_damage(head, tail, size):
+    if not (head.startswith(b"RIFF") and head[8:12] == b"AVI "): return 100.0
+    riff_len = struct.unpack("<I", head[4:8])[0] + 8
+    if riff_len > size: return truncated_damage(riff_len, size)
+    if head[12:16] != b"LIST": return 50.0 # Thiếu LIST hdrl ngay sau header
+    return 0.0
+
+def sampled_mkv_damage(head, tail, size):
+    if not head.startswith(EBML_MAGIC): return 100.0
+    if MKV_SEGMENT not in head[:4096]: return 50.0 # Header EBML không dẫn tới Segment
+    return 0.0
+
+def sampled_zip_damage(head, tail, size):
+    if not head.startswith(b"PK\x03\x04"): return 100.0
+    eocd = tail.rfind(b"PK\x05\x06")
+    if eocd < 0 or eocd + 22 > len(tail): return 100.0 # Mất End Of Central Directory
+    cd_size, cd_offset = struct.unpack("<II", tail[eocd + 12:eocd + 20])
+    if cd_offset == 0xFFFFFFFF: return 0.0 # ZIP64: vị trí thật nằm ở bản ghi khác
+    if cd_offset + cd_size > size: return truncated_damage(cd_offset + cd_size, size)
+    cd = sampled_at(head, tail, size, cd_offset, 4)
+    if cd is not None and cd != b"PK\x01\x02": return 50.0 # Central Directory bị ghi đè
+    return 0.0
+
+def sampled_rar_damage(head, tail, size):
+    if not head.startswith(RAR_MAGIC): return 100.0
+    if not any(end in tail[-32:] for end in RAR_END_BLOCKS): return 30.0 # Mất khối kết thúc (cụt / nhiều volume)
+    return 0.0
+
+def sampled_7z_damage(head, tail, size):
+    if not head.startswith(SEVENZIP_MAGIC) or len(head) < 32: return 100.0
+    next_offset, next_size = struct.unpack("<QQ", head[12:28])
+    end = 32 + next_offset + next_size
+    if end > size: return 100.0 # Header nằm cuối file đã mất -> không liệt kê / giải nén được
+    hdr = sampled_at(head, tail, size, 32 + next_offset, 1)
+    if hdr is not None and hdr[0] not in (0x01, 0x17): return 50.0 # Header / EncodedHeader bị ghi đè
+    return 0.0
+
+CONTAINER_CHECKS = {
+    "MP4": sampled_mp4_damage, "AVI": sampled_avi_damage, "MKV": sampled_mkv_damage,
+    "ZIP": sampled_zip_damage, "RAR": sampled_rar_damage, "7Z": sampled_7z_damage,
+}
+
+def analyze_sampled_container(kind, head, tail, size, dead_pct, joined):
+    """Điểm = 100 - max(hư hỏng cấu trúc, % khối giữa bị xóa trắng); entropy gần 0 -> đã bị xóa."""
+    final_damage = max(dead_pct, CONTAINER_CHECKS[kind](head, tail, size))
+    ent, _ = calculate_entropy_and_zeros(joined)
+    if ent < 1.0: final_damage = 100.0
+    return 100.0 - final_damage
+
+def analyze_sample_integrity(sample, ext):
+    """
+    Giống analyze_file_integrity nhưng trên mẫu của read_sample.
+    Mẫu là nguyên file -> phân tích đầy đủ. Ngược lại: cấu trúc từ header/footer,
+    mức hư hỏng ~ tỉ lệ khối giữa bị xóa trắng (is_dead_block).
+    """
+    size, windows = sample["size"], sample["windows"]
+    if not windows or size == 0 or not ext: return None
+    ext = ext.lower().replace(".", "")
+    kind = CONTAINER_EXTS.get(ext)
+    if len(windows) == 1:
+        data = bytes(windows[0][1])
+        if kind is None:
+            return analyze_file_integrity(data, ext)
+        # File nhỏ đọc nguyên: các khối giữa = các đoạn SAMPLE_WINDOW trừ đầu / cuối
+        middle = [data[i:i + SAMPLE_WINDOW] for i in range(SAMPLE_WINDOW, len(data) - SAMPLE_WINDOW, SAMPLE_WINDOW)]
+        dead_pct = sum(map(is_dead_block, middle)) * 100.0 / len(middle) if middle else 0.0
+        return analyze_sampled_container(kind, data, data, size, dead_pct, data)
+
+    head, tail = windows[0][1], windows[-1][1]
+    middle = [w for _, w in windows[1:-1]]
+    dead_pct = sum(map(is_dead_block, middle)) * 100.0 / len(middle) if middle else 0.0
+
+    img_type = None
+    if ext in ['png']: img_type = "PNG"
+    elif ext in ['jpg', 'jpeg']: img_type = "JPEG"
+    elif ext in ['webp']: img_type = "WEBP"
+
+    if img_type:
+        final_damage = max(dead_pct, analyze_sampled_image(head, tail, size, img_type))
+        ent, _ = calculate_entropy_and_zeros(b"".join(w for _, w in windows))
+        if ent < 1.0: final_damage = 100.0
+        return 100.0 - final_damage
+
+    if ext in ['docx', 'xlsx', 'pptx', 'odt', 'ods', 'odp']:
+        return analyze_sampled_office(head, tail, size, dead_pct)
+
+    if ext == 'pdf':
+        return analyze_sampled_pdf(head, tail, b"".join(w for _, w in windows))
+
+    if kind:
+        return analyze_sampled_container(kind, head, tail, size, dead_pct, b"".join(w for _, w in windows))
+
+    return None
+
+def analyze_sampled_integrity(read_at, offset, size, ext, budget=DEFAULT_BUDGET):
+    """Đọc mẫu theo ngân sách rồi chấm điểm (I/O tối đa ~ window * (blocks + 2) mỗi file)."""
+    return analyze_sample_integrity(read_sample(read_at, offset, size, budget, ext), ext)
+
+# ==========================================
+# 7. CLI
 # ==========================================
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
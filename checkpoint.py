@@ -0,0 +1,87 @@
+# checkpoint.py
+"""
+CHECKPOINT CHO QUÉT SÂU (tiếp tục quét sau khi bị dừng / crash)
+Mỗi nguồn quét có một file checkpoints/deep_<tên>.json gồm:
+  - offset: mọi header nằm trước vị trí này đã được xử lý xong
+  - carry_start: đầu vùng nối (các header ở [carry_start, offset) có thể chưa thấy tail -> quét lại)
+  - partition_offset: quét một phân vùng trên ổ vật lý (--offset); offset / carry_start tính từ đầu phân vùng
+  - results: các file đã cắt được tới thời điểm ghi
+Quét xong trọn vẹn thì file checkpoint bị xóa -> những file còn lại là các lần quét dở dang.
+"""
+
+import os
+import re
+import json
+import datetime
+
+CHECKPOINT_DIR = "checkpoints"
+
+
+def checkpoint_path(source_path, partition_offset=0):
+    name = re.sub(r'[\\/:*?"<>|.]', '_', source_path).strip("_") or "source"
+    if partition_offset:
+        name += f"_p{partition_offset}" # Mỗi phân vùng của cùng một ổ có checkpoint riêng
+    return os.path.join(CHECKPOINT_DIR, f"deep_{name}.json")
+
+
+def save_checkpoint(source_path, max_scan_gb, offset, carry_start, results, partition_offset=0):
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = checkpoint_path(source_path, partition_offset)
+    data = {
+        "source": source_path,
+        "partition_offset": partition_offset,
+        "max_scan_gb": max_scan_gb,
+        "offset": offset,
+        "carry_start": carry_start,
+        "timestamp": datetime.datetime.now().strftime("%Y%m%d_%H%M%S"),
+        "results": results,
+    }
+    # Ghi ra file tạm rồi đổi tên -> không bao giờ để lại checkpoint ghi dở
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_checkpoint(source_path, partition_offset=0):
+    path = checkpoint_path(source_path, partition_offset)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def clear_checkpoint(source_path, partition_offset=0):
+    path = checkpoint_path(source_path, partition_offset)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def list_incomplete():
+    """Danh sách các lần quét sâu dở dang (không kèm results để nhẹ)."""
+    items = []
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return items
+    for fname in sorted(os.listdir(CHECKPOINT_DIR)):
+        if not (fname.startswith("deep_") and fname.endswith(".json")):
+            continue
+        path = os.path.join(CHECKPOINT_DIR, fname)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        items.append({
+            "source": data.get("source", ""),
+            "partition_offset": data.get("partition_offset", 0),
+            "max_scan_gb": data.get("max_scan_gb", 0),
+            "offset": data.get("offset", 0),
+            "found": len(data.get("results", [])),
+            "timestamp": data.get("timestamp", ""),
+            "file_path": path,
+        })
+    return items
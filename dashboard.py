@@ -8,6 +8,7 @@ from PyQt5.QtCore import Qt, QMargins, pyqtSignal, QEvent, QPointF
 from PyQt5.QtGui import QFont, QColor, QPainter, QPen, QLinearGradient, QPalette, QBrush, QCursor, QIcon
 from PyQt5.QtChart import (QChart, QChartView, QPieSeries, QPieSlice, QBarSeries, 
                            QBarSet, QBarCategoryAxis, QValueAxis, QStackedBarSeries, QAbstractBarSeries)
+from result_stream import load_results
 
 # --- UTILS ---
 try:
@@ -225,9 +226,7 @@ class DashboardWidget(QWidget):
         self.init_ui()
 
     def load_data_from_file(self):
-        if not os.path.exists("deleted_files.json"): return []
-        try:
-            with open("deleted_files.json", "r", encoding="utf-8") as f: return json.load(f)
+        try: return load_results()
         except: return []
 
     def compute_statistics(self):
@@ -206,7 +206,8 @@ class RecoverApp(QWidget):
             return self.disk_data["disks"][data["index"]]
         elif data["type"] == "volume":
             disk = self.disk_data["disks"][data["disk_index"]]
-            return disk["volumes"][data["vol_index"]]
+            # Kèm đường dẫn ổ vật lý: phân vùng ẩn chỉ quét được qua ổ chứa nó + offset
+            return dict(disk["volumes"][data["vol_index"]], disk_path=disk["path"])
         return None
 
     def scan_model(self):
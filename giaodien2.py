@@ -9,10 +9,12 @@ from PyQt5.QtWidgets import QStackedWidget, QTextEdit, QPlainTextEdit, QDialogBu
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QDateTime
 from PyQt5.QtGui import QFont, QPixmap, QImage, QColor
 from dashboard import DashboardWidget
-import sys, json, subprocess, os, datetime, re
+import sys, json, subprocess, os, datetime, re, base64
 from styles import get_app_stylesheet
 from config import MENU_ITEMS
 from utils import format_size # Giả định format_size, NumericItem được import từ utils
+import image_reader
+from result_stream import parse_file_line
 import logging # <-- Import thư viện logging
 
 # --- CẤU HÌNH GHI LOG (Thêm đoạn này vào) ---
@@ -174,20 +176,36 @@ class NumericItem(QTableWidgetItem):
                 except Exception: pass
         return super().__lt__(other)
 # (Giữ nguyên Helpers và ScanWorker)
-def read_file_from_image(image_path, offset, size, max_preview=1024*100*100):
+def read_file_from_image(image_path, offset, size, max_preview=1024*100*100, runs=None):
+    """runs (NTFS): [[offset, length], ...] -> đọc đúng các mảnh theo thứ tự thay vì một đoạn liên tục từ offset."""
     try:
         read_size = min(int(size or 0), max_preview)
         if not image_path:
             print("Lỗi đọc file: image_path là None")
             return b""
-        with open(image_path, "rb") as f:
-            f.seek(int(offset or 0))
-            data = f.read(read_size)
-        return data
+        # Dùng chung một reader (mmap với file image) cho preview / hex / recover
+        reader = image_reader.get_shared_reader(image_path)
+        if runs:
+            return reader.read_runs(runs, read_size)
+        return reader.read_at(int(offset or 0), read_size)
     except Exception as e:
         print(f"Lỗi đọc file '{image_path}':", e)
         return b""
 
+def read_entry_data(image_path, chi_tiet, max_preview=1024*100*100):
+    """
+    Dữ liệu của một kết quả quét: $DATA resident (NTFS, có sẵn trong kết quả, không đọc đĩa)
+    -> theo runs (file phân mảnh) -> đoạn liên tục từ offset.
+    """
+    resident = chi_tiet.get("resident")
+    if resident:
+        try:
+            return base64.b64decode(resident)[:max_preview]
+        except ValueError:
+            pass
+    return read_file_from_image(image_path, get_best_offset(chi_tiet), chi_tiet.get("size", 0), max_preview,
+                                runs=chi_tiet.get("runs"))
+
 def get_best_offset(chi_tiet):
     """
     Ưu tiên offset (Deep Scan).
@@ -212,15 +230,36 @@ def get_best_offset(chi_tiet):
 
     return 0
 
+def resolve_scan_target(target):
+    """
+    Phân vùng ẩn (path chỉ là nhãn "PartitionN"): đổi path sang ổ vật lý chứa nó + partition_offset.
+    Dùng chung cho lúc quét lẫn preview / hex / recover -> mọi lần đọc đều đúng nguồn với lần quét.
+    """
+    if target and target.get("disk_path") and not str(target.get("path") or "").startswith("\\\\.\\"):
+        return dict(target, path=target["disk_path"], partition_offset=target.get("offset", 0))
+    return target
+
+def to_file_info(f):
+    """Chuẩn hóa 1 kết quả thô từ script quét thành dòng của bảng (phòng trường hợp thiếu trường)."""
+    return {
+        "Tên file": f.get("name", "Unknown"),
+        "Loại": f.get("type", "Unknown"),
+        "Size": f.get("size", 0),
+        "Ngày tạo": f.get("modified", "") or f.get("created", ""),
+        "Tình trạng": f.get("status", ""),
+        "Chi tiết": f
+    }
+
 class ScanWorker(QThread):
     file_found = pyqtSignal(dict)
     finished = pyqtSignal()
     progress = pyqtSignal(int)
 
-    def __init__(self, target_info, scan_type="quick"):
+    def __init__(self, target_info, scan_type="quick", resume=False):
         super().__init__()
         self.target_info = target_info
         self.scan_type = scan_type
+        self.resume = resume
         self.running = True
         self.process = None 
 
@@ -237,21 +276,29 @@ class ScanWorker(QThread):
         
         command = []
         script_path = ""
+        extra_args = []
 
         try:
             # 2. Xây dựng đường dẫn tuyệt đối tới script con
             if self.scan_type == "quick":
-                if fs_type in ["FAT", "FAT32", "EXFAT"]:
+                if fs_type in ["FAT", "FAT12", "FAT16", "FAT32"]:
                     script_path = os.path.join(base_dir, "quet_nhanh_fat.py")
+                elif fs_type == "EXFAT":
+                    script_path = os.path.join(base_dir, "quet_nhanh_exfat.py")
                 elif fs_type == "NTFS":
                     script_path = os.path.join(base_dir, "quet_nhanh_ntfs.py")
                 else:
-                    print("Filesystem không hỗ trợ quét nhanh.")
-                    self.finished.emit()
-                    return
+                    # Ổ vật lý / image nguyên ổ / phân vùng chưa rõ FS -> đọc bảng phân vùng rồi chia engine
+                    script_path = os.path.join(base_dir, "quet_nhanh_dia.py")
+                    if "partition_offset" in self.target_info:
+                        # Phân vùng ẩn (resolve_scan_target): chỉ quét phân vùng tại offset này trên ổ vật lý
+                        extra_args = ["--offset", str(self.target_info["partition_offset"])]
             else:
                 # Quét sâu
                 script_path = os.path.join(base_dir, "quet_sau.py")
+                if "partition_offset" in self.target_info:
+                    # Phân vùng ẩn: chỉ carve vùng của phân vùng trên ổ vật lý
+                    extra_args = ["--offset", str(self.target_info["partition_offset"])]
 
             # Kiểm tra script có tồn tại không
             if not os.path.exists(script_path):
@@ -259,7 +306,9 @@ class ScanWorker(QThread):
                 self.finished.emit()
                 return
 
-            command = [sys.executable, script_path, image_path]
+            command = [sys.executable, script_path, image_path] + extra_args
+            if self.scan_type != "quick" and self.resume:
+                command.append("--resume") # Tiếp tục từ checkpoint của lần quét sâu trước
             print(f"[INFO] Running: {command}")
 
             # 3. Chạy subprocess với cwd=base_dir (QUAN TRỌNG)
@@ -275,7 +324,8 @@ class ScanWorker(QThread):
                 cwd=base_dir
             )
 
-            # Đọc log realtime
+            # Đọc log realtime: PROGRESS n -> thanh tiến độ, FILE {...} -> thêm dòng vào bảng ngay
+            found_count = 0
             for line in self.process.stdout:
                 if not line: continue
                 text = line.strip()
@@ -287,6 +337,12 @@ class ScanWorker(QThread):
                     parts = text.split()
                     if len(parts) >= 2 and parts[1].isdigit():
                         self.progress.emit(int(parts[1]))
+                    continue
+
+                f = parse_file_line(text)
+                if f is not None and self.running:
+                    self.file_found.emit(to_file_info(f))
+                    found_count += 1
 
             self.process.wait()
 
@@ -300,39 +356,8 @@ class ScanWorker(QThread):
             print("Lỗi khi chạy subprocess:", e)
             self.finished.emit()
             return
-        
-        # 4. Đọc file JSON kết quả bằng đường dẫn tuyệt đối
-        result_json = os.path.join(base_dir, "deleted_files.json")
-        
-        if not os.path.exists(result_json):
-            print(f"[LỖI] Script chạy xong nhưng không thấy file: {result_json}")
-            # Gợi ý: Kiểm tra xem quet_sau.py có lệnh ghi file json không
-            self.finished.emit()
-            return
-        
-        try:
-            with open(result_json, "r", encoding="utf-8") as f:
-                all_files = json.load(f)
-        except Exception as e:
-            print("Lỗi đọc JSON:", e)
-            self.finished.emit()
-            return
 
-        # Emit dữ liệu
-        for f in all_files:
-            if not self.running: break
-            
-            # Chuẩn hóa dữ liệu phòng trường hợp thiếu trường
-            file_info = {
-                "Tên file": f.get("name", "Unknown"),
-                "Loại": f.get("type", "Unknown"),
-                "Size": f.get("size", 0),
-                "Ngày tạo": f.get("modified", "") or f.get("created", ""),
-                "Tình trạng": f.get("status", ""),
-                "Chi tiết": f
-            }
-            self.file_found.emit(file_info)
-        log_action(f"Quá trình quét hoàn tất. Tìm thấy {len(all_files)} file.") # <--- Thêm dòng này
+        log_action(f"Quá trình quét hoàn tất. Tìm thấy {found_count} file.") # <--- Thêm dòng này
         self.finished.emit()
 
     def stop(self):
@@ -486,6 +511,8 @@ class DetailPreviewPanel(QFrame):
                     value = str(value)
             elif key in ("size"):
                     value = format_size(int(value))
+            elif key == "resident":
+                    value = "Có (nội dung nằm trong MFT record)"
             
             text_lines.append(f"<b>{field_name}:</b> {value}")
             
@@ -500,9 +527,7 @@ class DetailPreviewPanel(QFrame):
 
         file_type = (chi_tiet.get("type") or "").lower()
         file_name = chi_tiet.get("name", "")
-        offset = get_best_offset(chi_tiet)
-        size = chi_tiet.get("size", 0)
-        data = read_file_from_image(image_path, offset, size)
+        data = read_entry_data(image_path, chi_tiet)
 
 
         temp_dir = "recovered_files"
@@ -515,7 +540,7 @@ class DetailPreviewPanel(QFrame):
                 print(f"[!] Lỗi đọc tạm: {e}")
                 data = b""
         else:
-            data = read_file_from_image(image_path, offset, size)
+            data = read_entry_data(image_path, chi_tiet)
 
         if file_type in ("jpg", "jpeg", "png", "bmp", "gif", "webp"):
             pix = QPixmap()
@@ -547,15 +572,16 @@ class DetailPreviewPanel(QFrame):
 class RecoverDeletedApp(QMainWindow):
     home_requested = pyqtSignal()
 
-    def __init__(self, target=None, scan_type="quick", session_file=None):
+    def __init__(self, target=None, scan_type="quick", session_file=None, resume=False):
         super().__init__()
         
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget) 
         
         self.session_file = session_file
-        self.target_info = target
+        self.target_info = resolve_scan_target(target)
         self.scan_type = scan_type
+        self.resume = resume
         self.deleted_files = []
         
         self.setStyleSheet(get_app_stylesheet())
@@ -773,7 +799,8 @@ class RecoverDeletedApp(QMainWindow):
         self.deleted_files = []
         self.table.setRowCount(0)
         
-        self.worker = ScanWorker(self.target_info, self.scan_type)
+        self.worker = ScanWorker(self.target_info, self.scan_type, resume=self.resume)
+        self.resume = False # "Quét lại" sau đó luôn quét từ đầu
         
         # 1. Tạo và hiện cửa sổ Popup
         self.progress_window = ScanProgressWindow(self)
@@ -946,9 +973,9 @@ class RecoverDeletedApp(QMainWindow):
         # Nếu không có file tạm, đọc trực tiếp từ Image/Disk
         if not data:
             image_path = self.target_info.get("path") if self.target_info else None
-            if image_path:
-                # Đọc raw từ disk
-                data = read_file_from_image(image_path, file_offset, size=4096, max_preview=4096)
+            if image_path or chi_tiet.get("resident"):
+                # Đọc raw từ disk (file resident: lấy luôn từ kết quả quét)
+                data = read_entry_data(image_path, chi_tiet, max_preview=4096)
                 # Khi xem raw disk, offset hiển thị là vị trí thực trên ổ đĩa
                 display_offset = file_offset
 
@@ -1019,9 +1046,8 @@ class RecoverDeletedApp(QMainWindow):
                 return
 
             image_path = self.target_info.get("path")
-            offset = get_best_offset(chi_tiet)
             size = chi_tiet.get("size", 0)
-            data = read_file_from_image(image_path, offset, size)
+            data = read_entry_data(image_path, chi_tiet, max_preview=int(size or 0))
 
             with open(save_path, "wb") as f:
                 f.write(data)
@@ -1111,9 +1137,8 @@ class RecoverDeletedApp(QMainWindow):
                         dst.write(src.read())
                 else:
                     # Chúng ta đã check image_path ở trên
-                    offset = get_best_offset(chi_tiet)
                     size = chi_tiet.get("size", 0)
-                    data = read_file_from_image(image_path, offset, size)
+                    data = read_entry_data(image_path, chi_tiet, max_preview=int(size or 0))
                     with open(output_path, "wb") as f:
                         f.write(data)
                 log_action(f"[Thành công] Khôi phục file {file_name} -> {output_path}") # <--- Thêm dòng này
@@ -1210,14 +1235,7 @@ class RecoverDeletedApp(QMainWindow):
             elif isinstance(session_data, list):
                 QMessageBox.warning(self, "Phiên cũ", "Đây là phiên bản lưu cũ (chỉ chứa dữ liệu thô). Đang cố gắng chuyển đổi...")
                 for f_raw in session_data:
-                    files_to_load.append({
-                        "Tên file": f_raw.get("name", ""),
-                        "Loại": f_raw.get("type", ""),
-                        "Size": f_raw.get("size", 0),
-                        "Ngày tạo": f_raw.get("modified", "") or f_raw.get("created", ""),
-                        "Tình trạng": f_raw.get("status", ""),
-                        "Chi tiết": f_raw
-                    })
+                    files_to_load.append(to_file_info(f_raw))
             else:
                 raise ValueError("Định dạng file session không hợp lệ.")
 
@@ -1259,6 +1277,7 @@ class RecoverDeletedApp(QMainWindow):
 
         # ✅ CHỈ XÓA FILE TẠM
         self.cleanup_recovered_files()
+        image_reader.close_shared_readers()
 
         # ❌ KHÔNG đụng deleted_files
         # ❌ KHÔNG reset table
@@ -1358,4 +1377,5 @@ class RecoverDeletedApp(QMainWindow):
             self.worker.wait()
         # ✅ THOÁT LÀ XÓA FILE TẠM
         self.cleanup_recovered_files()
+        image_reader.close_shared_readers()
         event.accept()
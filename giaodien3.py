@@ -8,6 +8,7 @@ from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QFont, QColor 
 import json, os, sys 
 from styles import get_app_stylesheet
+import checkpoint
 from datetime import datetime
 
 # --- 1. Custom QGraphicsEffect (Hiệu ứng Đổ bóng tùy chỉnh) ---
@@ -23,6 +24,7 @@ class DropShadowEffect(QGraphicsDropShadowEffect):
 class SessionManagerApp(QWidget):
     home_requested = pyqtSignal()
     session_open_requested = pyqtSignal(str) 
+    resume_scan_requested = pyqtSignal(str, object) # Đường dẫn nguồn + offset phân vùng của lần quét sâu dở dang
     def __init__(self):
         super().__init__()
         self.setStyleSheet(get_app_stylesheet())
@@ -136,8 +138,10 @@ class SessionManagerApp(QWidget):
         self.table.setSortingEnabled(False) 
         self.table.setRowCount(0)
         index_path = os.path.join("sessions", "index.json")
+        # Các lần quét sâu bị dừng / crash (còn checkpoint) -> có thể tiếp tục
+        incomplete = checkpoint.list_incomplete()
 
-        if not os.path.exists(index_path):
+        if not os.path.exists(index_path) and not incomplete:
             self.table.setRowCount(1)
             self.table.setItem(0, 0, QTableWidgetItem("Chưa có phiên làm việc nào được lưu."))
             self.table.setSpan(0, 0, 1, 4)
@@ -153,13 +157,17 @@ class SessionManagerApp(QWidget):
         self.table.setColumnHidden(2, False)
         self.table.setColumnHidden(3, False)
         
-        try:
-            with open(index_path, "r", encoding="utf-8") as f:
-                sessions = json.load(f)
-        except Exception as e:
-            QMessageBox.warning(self, "Lỗi", f"Không thể đọc file index.json:\n{e}")
-            self.table.setSortingEnabled(True) # Bật lại sắp xếp
-            return
+        self.table.clearSpans()
+
+        sessions = []
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, "r", encoding="utf-8") as f:
+                    sessions = json.load(f)
+            except Exception as e:
+                QMessageBox.warning(self, "Lỗi", f"Không thể đọc file index.json:\n{e}")
+                self.table.setSortingEnabled(True) # Bật lại sắp xếp
+                return
 
         for row, sess in enumerate(sessions):
             self.table.insertRow(row)
@@ -176,6 +184,26 @@ class SessionManagerApp(QWidget):
             self.table.setItem(row, 2, QTableWidgetItem(display_ts))
             self.table.setItem(row, 3, QTableWidgetItem(sess.get("file_path", "")))
 
+        # Thêm các lần quét sâu dở dang vào cuối bảng
+        for item in incomplete:
+            row = self.table.rowCount()
+            self.table.insertRow(row)
+            done_gb = item["offset"] / (1024 ** 3)
+            name_item = QTableWidgetItem(
+                f"⏸ Quét sâu dở dang ({done_gb:.2f}/{item['max_scan_gb']} GB, {item['found']} file)"
+            )
+            name_item.setForeground(QColor("#ef6c00"))
+            name_item.setData(Qt.UserRole, item["source"]) # Đánh dấu dòng checkpoint
+            name_item.setData(Qt.UserRole + 1, item["partition_offset"])
+            self.table.setItem(row, 0, name_item)
+            self.table.setItem(row, 1, QTableWidgetItem(item["source"]))
+            try:
+                display_ts = datetime.strptime(item["timestamp"], "%Y%m%d_%H%M%S").strftime("%d/%m/%Y %H:%M:%S")
+            except ValueError:
+                display_ts = item["timestamp"]
+            self.table.setItem(row, 2, QTableWidgetItem(display_ts))
+            self.table.setItem(row, 3, QTableWidgetItem(item["file_path"]))
+
         self.table.resizeColumnsToContents()
         self.table.setSortingEnabled(True) # Bật lại sắp xếp sau khi load xong
 
@@ -225,6 +253,12 @@ class SessionManagerApp(QWidget):
             QMessageBox.information(self, "Chưa chọn", "Hãy chọn một phiên để mở.")
             return
 
+        # Dòng quét sâu dở dang -> yêu cầu tiếp tục quét thay vì mở phiên
+        resume_source = self.table.item(row, 0).data(Qt.UserRole)
+        if resume_source:
+            self.resume_scan_requested.emit(resume_source, self.table.item(row, 0).data(Qt.UserRole + 1) or 0)
+            return
+
         file_path = self.table.item(row, 3).text()
         print("DEBUG: Trying to open session file:", file_path)
 
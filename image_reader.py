@@ -0,0 +1,164 @@
+# image_reader.py
+"""
+BỘ ĐỌC IMAGE DÙNG CHUNG (mmap / file thường)
+Chức năng:
+  - Với file image (.dd/.img/...): ánh xạ cả file vào bộ nhớ bằng mmap,
+    mọi lần đọc chỉ là cắt lát (slice) trên map -> không tốn syscall seek/read.
+  - Với ổ đĩa thật (\\\\.\\F:, \\\\.\\PhysicalDriveN) hoặc khi mmap lỗi: tự động dùng file thường.
+  - Giao diện giống file (seek/read/tell/readinto) để các hàm cũ nhận `f` vẫn chạy được.
+  - read_runs: đọc file phân mảnh theo danh sách run [[offset, length], ...] (NTFS), run thưa -> byte 0.
+"""
+
+import os
+import mmap
+
+# Đuôi file được coi là image -> bật mmap mặc định
+MMAP_EXTENSIONS = (".dd", ".img", ".raw", ".bin", ".001", ".ima", ".vhd")
+
+
+def is_image_file(path):
+    """True nếu path là file image thường (không phải ổ đĩa vật lý/phân vùng)."""
+    if not path or path.startswith("\\\\.\\"):
+        return False
+    return os.path.isfile(path) and path.lower().endswith(MMAP_EXTENSIONS)
+
+
+class ImageReader:
+    """Đọc image theo offset tuyệt đối. `map` khác None khi đang chạy ở chế độ mmap."""
+
+    def __init__(self, path, use_mmap=None):
+        self.path = path
+        self.f = open(path, "rb")
+        self.map = None
+        self.pos = 0
+
+        if use_mmap is None:
+            use_mmap = is_image_file(path)
+        if use_mmap:
+            try:
+                self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                self.map = None # File rỗng / thiết bị không hỗ trợ -> dùng file thường
+
+    # --- Đọc theo offset ---
+    def read_at(self, offset, size):
+        if self.map is not None:
+            return self.map[offset:offset + size]
+        self.f.seek(offset)
+        return self.f.read(size)
+
+    def read_runs(self, runs, size, start=0):
+        """
+        Đọc đoạn logic [start, start + size) của file nằm trên các run theo thứ tự.
+        runs: [[offset tuyệt đối, số byte], ...]; offset None = run thưa (sparse) -> trả byte 0.
+        Các run liền kề trên đĩa được gộp -> mỗi đoạn liên tục chỉ một lần đọc lớn.
+        """
+        parts = []
+        end = start + size
+        pos = 0
+        for offset, length in merge_runs(runs):
+            if pos >= end:
+                break
+            lo, hi = max(start, pos), min(end, pos + length)
+            if lo < hi:
+                if offset is None:
+                    parts.append(bytes(hi - lo))
+                else:
+                    parts.append(self.read_at(offset + lo - pos, hi - lo))
+            pos += length
+        return b"".join(parts)
+
+    def size(self):
+        if self.map is not None:
+            return len(self.map)
+        try:
+            return os.fstat(self.f.fileno()).st_size
+        except OSError:
+            return 0
+
+    # --- Giao diện giống file ---
+    def seek(self, offset, whence=0):
+        if self.map is None:
+            return self.f.seek(offset, whence)
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += len(self.map)
+        self.pos = offset
+        return self.pos
+
+    def tell(self):
+        return self.pos if self.map is not None else self.f.tell()
+
+    def read(self, size=-1):
+        if self.map is None:
+            return self.f.read(size)
+        if size is None or size < 0:
+            size = len(self.map) - self.pos
+        data = self.map[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+    def readinto(self, buf):
+        if self.map is None:
+            return self.f.readinto(buf)
+        data = self.map[self.pos:self.pos + len(buf)]
+        n = len(data)
+        buf[:n] = data
+        self.pos += n
+        return n
+
+    def close(self):
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                pass # Còn memoryview trỏ vào map -> để GC đóng sau
+            self.map = None
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_image(path, use_mmap=None):
+    return ImageReader(path, use_mmap)
+
+
+def merge_runs(runs):
+    """Gộp các run nối tiếp nhau trên đĩa (và các run thưa liền nhau) thành một run."""
+    merged = []
+    for offset, length in runs:
+        if length <= 0:
+            continue
+        if merged:
+            last_off, last_len = merged[-1]
+            if (offset is None and last_off is None) or \
+                    (offset is not None and last_off is not None and last_off + last_len == offset):
+                merged[-1] = (last_off, last_len + length)
+                continue
+        merged.append((offset, length))
+    return merged
+
+
+# === READER DÙNG CHUNG (cho GUI: preview / hex / recover) ===
+_shared_readers = {}
+
+def get_shared_reader(path):
+    """Mở một lần, dùng lại cho mọi lần đọc tiếp theo trên cùng image."""
+    reader = _shared_readers.get(path)
+    if reader is None:
+        reader = open_image(path)
+        _shared_readers[path] = reader
+    return reader
+
+def close_shared_readers():
+    for reader in _shared_readers.values():
+        try:
+            reader.close()
+        except Exception:
+            pass
+    _shared_readers.clear()
@@ -1,4 +1,4 @@
-import sys
+import sys, os
 from PyQt5.QtWidgets import QApplication, QMainWindow, QStackedWidget
 from giaodien1 import RecoverApp
 from giaodien2 import RecoverDeletedApp
@@ -29,6 +29,7 @@ class MainWindow(QMainWindow):
 
         self.page_session.home_requested.connect(self.go_to_home_page)
         self.page_session.session_open_requested.connect(self.open_session_scan)
+        self.page_session.resume_scan_requested.connect(self.resume_deep_scan)
 
         # Mặc định về Home
         self.go_to_home_page()
@@ -41,7 +42,7 @@ class MainWindow(QMainWindow):
         self.page_session.load_sessions()
         self.stack.setCurrentWidget(self.page_session)
 
-    def go_to_scan_page(self, target_info, scan_type):
+    def go_to_scan_page(self, target_info, scan_type, resume=False):
         # Xóa trang cũ an toàn
         if self.page_scan is not None:
             self.stack.setCurrentWidget(self.page_home)   # tránh nhấp nháy
@@ -50,12 +51,19 @@ class MainWindow(QMainWindow):
             self.stack.removeWidget(self.page_scan)
 
         # Tạo trang quét mới
-        self.page_scan = RecoverDeletedApp(target=target_info, scan_type=scan_type)
+        self.page_scan = RecoverDeletedApp(target=target_info, scan_type=scan_type, resume=resume)
         self.page_scan.home_requested.connect(self.go_to_home_page)
 
         self.stack.addWidget(self.page_scan)
         self.stack.setCurrentWidget(self.page_scan)
 
+    def resume_deep_scan(self, source_path, partition_offset=0):
+        # Checkpoint chỉ lưu đường dẫn nguồn (+ offset phân vùng) -> dựng lại target tối thiểu cho quét sâu
+        target_info = {"path": source_path, "filesystem": "", "label": os.path.basename(source_path) or source_path}
+        if partition_offset:
+            target_info["partition_offset"] = partition_offset
+        self.go_to_scan_page(target_info, "deep", resume=True)
+
     def open_session_scan(self, session_file_path):
         if self.page_scan is not None:
             self.stack.setCurrentWidget(self.page_home)
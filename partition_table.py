@@ -0,0 +1,150 @@
+# partition_table.py
+"""
+ĐỌC BẢNG PHÂN VÙNG (MBR / EBR / GPT) CỦA Ổ ĐĨA HOẶC FILE IMAGE NGUYÊN Ổ
+  - read_partitions(f): danh sách phân vùng kèm offset (byte) và hệ thống tập tin nhận diện từ boot sector.
+  - Image chỉ chứa một phân vùng (không có bảng phân vùng) -> một phân vùng duy nhất ở offset 0.
+  - detect_filesystem(boot): "NTFS" / "EXFAT" / "FAT12" / "FAT16" / "FAT32" hoặc None.
+  - Kích thước sector logic (512 / 4096) được dò từ header GPT hoặc boot sector của phân vùng đầu tiên.
+"""
+
+import uuid
+import struct
+
+SECTOR_SIZES = (512, 4096) # Sector logic: ổ thường / 512e và ổ 4Kn (LBA tính theo 4096 byte)
+EXTENDED_TYPES = (0x05, 0x0F, 0x85)
+GPT_PROTECTIVE = 0xEE
+
+
+def detect_filesystem(boot):
+    """Nhận diện hệ thống tập tin từ boot sector của phân vùng."""
+    if len(boot) < 512 or boot[510:512] != b"\x55\xAA":
+        return None
+    if boot[3:11] == b"NTFS    ":
+        return "NTFS"
+    if boot[3:11] == b"EXFAT   ":
+        return "EXFAT"
+    bps = struct.unpack("<H", boot[11:13])[0]
+    spc = boot[13]
+    if bps not in (512, 1024, 2048, 4096) or spc == 0 or spc & (spc - 1):
+        return None
+    if boot[82:87] == b"FAT32":
+        return "FAT32"
+    if boot[54:59] in (b"FAT12", b"FAT16"):
+        return boot[54:59].decode()
+    # Không có nhãn: FATSz16 = 0 -> FAT32
+    if boot[16] in (1, 2) and struct.unpack("<H", boot[14:16])[0] > 0:
+        return "FAT32" if struct.unpack("<H", boot[22:24])[0] == 0 else "FAT16"
+    return None
+
+
+def boot_sector_size(boot):
+    """Bytes/sector ghi trong boot sector (exFAT lưu dạng lũy thừa 2 tại offset 108)."""
+    if boot[3:11] == b"EXFAT   ":
+        return 1 << boot[108] if boot[108] < 16 else 0
+    return struct.unpack("<H", boot[11:13])[0]
+
+
+def probe_sector_size(f, entries):
+    """
+    Sector logic của ổ từ các mục MBR: thử boot sector của phân vùng chính đầu tiên ở LBA*512 và LBA*4096.
+    Ưu tiên cỡ khớp với bytes/sector trong boot sector, không dò được -> 512.
+    """
+    for e in entries:
+        lba, count = struct.unpack("<II", e[8:16])
+        if not e[4] or not count or e[4] in EXTENDED_TYPES:
+            continue
+        found = [(sector, f.read_at(lba * sector, 512)) for sector in SECTOR_SIZES]
+        found = [(sector, boot) for sector, boot in found if detect_filesystem(boot)]
+        for sector, boot in found:
+            if boot_sector_size(boot) == sector:
+                return sector
+        if found:
+            return found[0][0]
+    return SECTOR_SIZES[0]
+
+
+def _partition(f, index, offset, size, scheme, type_id, name=""):
+    boot = f.read_at(offset, 512)
+    return {
+        "index": index,
+        "offset": offset,
+        "size": size,
+        "scheme": scheme,
+        "type": type_id,
+        "name": name,
+        "filesystem": detect_filesystem(boot),
+    }
+
+
+def read_ebr_chain(f, ext_lba, first_index, sector):
+    """Phân vùng logic trong phân vùng mở rộng (chuỗi EBR, offset tương đối so với đầu phân vùng mở rộng)."""
+    parts = []
+    ebr_lba = ext_lba
+    seen = set()
+    while ebr_lba not in seen:
+        seen.add(ebr_lba)
+        ebr = f.read_at(ebr_lba * sector, 512)
+        if len(ebr) < 512 or ebr[510:512] != b"\x55\xAA":
+            break
+        e1, e2 = ebr[446:462], ebr[462:478]
+        rel, count = struct.unpack("<II", e1[8:16])
+        if e1[4] and count:
+            parts.append(_partition(f, first_index + len(parts), (ebr_lba + rel) * sector,
+                                    count * sector, "MBR", f"0x{e1[4]:02X}"))
+        next_rel = struct.unpack("<I", e2[8:12])[0]
+        if e2[4] not in EXTENDED_TYPES or not next_rel:
+            break
+        ebr_lba = ext_lba + next_rel
+    return parts
+
+
+def read_gpt(f):
+    """GPT: header ở LBA 1 (thử sector 512 rồi 4096)."""
+    for sector in SECTOR_SIZES:
+        hdr = f.read_at(sector, 92)
+        if hdr[0:8] != b"EFI PART":
+            continue
+        entries_lba, count, entry_size = struct.unpack("<QII", hdr[72:88])
+        if not 0 < entry_size <= 4096 or count > 1024:
+            return []
+        table = f.read_at(entries_lba * sector, count * entry_size)
+        parts = []
+        for i in range(count):
+            e = table[i * entry_size:(i + 1) * entry_size]
+            if len(e) < 128 or e[0:16] == b"\x00" * 16:
+                continue
+            first, last = struct.unpack("<QQ", e[32:48])
+            name = e[56:128].decode("utf-16le", errors="ignore").split("\x00", 1)[0]
+            parts.append(_partition(f, len(parts), first * sector, (last - first + 1) * sector,
+                                    "GPT", str(uuid.UUID(bytes_le=bytes(e[0:16]))).upper(), name))
+        return parts
+    return []
+
+
+def read_partitions(f):
+    sector0 = f.read_at(0, 512)
+    if len(sector0) < 512 or sector0[510:512] != b"\x55\xAA":
+        return []
+
+    # Sector 0 đã là boot sector -> image của một phân vùng
+    fs = detect_filesystem(sector0)
+    if fs:
+        return [{"index": 0, "offset": 0, "size": f.size(), "scheme": "NONE",
+                 "type": "", "name": "", "filesystem": fs}]
+
+    entries = [sector0[446 + 16 * i:462 + 16 * i] for i in range(4)]
+    if any(e[4] == GPT_PROTECTIVE for e in entries):
+        return read_gpt(f)
+
+    sector = probe_sector_size(f, entries)
+    parts = []
+    for e in entries:
+        ptype = e[4]
+        lba, count = struct.unpack("<II", e[8:16])
+        if not ptype or not count:
+            continue
+        if ptype in EXTENDED_TYPES:
+            parts.extend(read_ebr_chain(f, lba, len(parts), sector))
+        else:
+            parts.append(_partition(f, len(parts), lba * sector, count * sector, "MBR", f"0x{ptype:02X}"))
+    return parts
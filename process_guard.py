@@ -0,0 +1,69 @@
+# process_guard.py
+"""
+GẮN TIẾN TRÌNH CON VỚI TIẾN TRÌNH CHA
+  - Dùng cho các script sinh tiến trình con (quet_nhanh_dia: engine từng phân vùng, quet_sau: worker carve).
+  - GUI dừng quét bằng terminate(): Windows là TerminateProcess (không chạy finally), POSIX là SIGTERM.
+  - guard_children(): Windows -> Job object KILL_ON_JOB_CLOSE; POSIX -> SIGTERM thành SystemExit
+    để khối finally của script tự dừng các tiến trình con.
+"""
+
+import os
+import sys
+import signal
+
+JOB_OBJECT_EXTENDED_LIMIT_INFORMATION = 9
+JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE = 0x2000
+
+
+def bind_children_to_self():
+    """
+    Windows: terminate() từ GUI là TerminateProcess -> không chạy finally, tiến trình con sẽ sống sót.
+    Đưa chính tiến trình này vào một Job object KILL_ON_JOB_CLOSE: tiến trình con sinh sau kế thừa Job,
+    khi tiến trình này chết (bất kể lý do) handle Job đóng và hệ điều hành kết thúc cả các tiến trình con.
+    """
+    if os.name != "nt":
+        return False
+    import ctypes
+    from ctypes import wintypes
+
+    class BasicLimit(ctypes.Structure):
+        _fields_ = [("PerProcessUserTimeLimit", ctypes.c_int64), ("PerJobUserTimeLimit", ctypes.c_int64),
+                    ("LimitFlags", wintypes.DWORD), ("MinimumWorkingSetSize", ctypes.c_size_t),
+                    ("MaximumWorkingSetSize", ctypes.c_size_t), ("ActiveProcessLimit", wintypes.DWORD),
+                    ("Affinity", ctypes.c_size_t), ("PriorityClass", wintypes.DWORD),
+                    ("SchedulingClass", wintypes.DWORD)]
+
+    class ExtendedLimit(ctypes.Structure):
+        _fields_ = [("BasicLimitInformation", BasicLimit), ("IoInfo", ctypes.c_uint64 * 6),
+                    ("ProcessMemoryLimit", ctypes.c_size_t), ("JobMemoryLimit", ctypes.c_size_t),
+                    ("PeakProcessMemoryUsed", ctypes.c_size_t), ("PeakJobMemoryUsed", ctypes.c_size_t)]
+
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.CreateJobObjectW.restype = wintypes.HANDLE
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    kernel32.AssignProcessToJobObject.argtypes = [wintypes.HANDLE, wintypes.HANDLE]
+    job = kernel32.CreateJobObjectW(None, None)
+    if not job:
+        return False
+    info = ExtendedLimit()
+    info.BasicLimitInformation.LimitFlags = JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE
+    if not kernel32.SetInformationJobObject(wintypes.HANDLE(job), JOB_OBJECT_EXTENDED_LIMIT_INFORMATION,
+                                            ctypes.byref(info), ctypes.sizeof(info)):
+        return False
+    # Không đóng handle: nó phải sống đúng bằng tiến trình này
+    return bool(kernel32.AssignProcessToJobObject(job, kernel32.GetCurrentProcess()))
+
+
+def guard_children():
+    """Gọi một lần ở đầu main(), trước khi sinh tiến trình con."""
+    if not bind_children_to_self():
+        # POSIX: terminate() là SIGTERM -> SystemExit để khối finally dừng các tiến trình con
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+
+
+def reset_child_sigterm():
+    """
+    initializer cho worker của ProcessPoolExecutor: POSIX fork kế thừa handler của guard_children,
+    SystemExit trong worker bị executor bắt như lỗi của task -> worker không chết khi bị terminate().
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
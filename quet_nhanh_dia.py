@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# quet_nhanh_dia.py
+"""
+QUÉT NHANH CẢ Ổ ĐĨA / IMAGE NGUYÊN Ổ (nhiều phân vùng)
+  - Đọc bảng phân vùng (MBR/EBR/GPT) bằng partition_table.read_partitions.
+  - Mỗi phân vùng có hệ thống tập tin hỗ trợ được giao cho engine tương ứng
+    (quet_nhanh_fat / quet_nhanh_exfat / quet_nhanh_ntfs) kèm --offset của phân vùng.
+  - Các phân vùng được quét ĐỒNG THỜI: mỗi phân vùng một tiến trình con + một luồng đọc stdout,
+    tổng thời gian ~ phân vùng lâu nhất thay vì tổng các phân vùng.
+  - Kết quả của mọi phân vùng gộp lại qua một ResultStream (thêm trường "partition"),
+    tiến độ = trung bình tiến độ các phân vùng.
+"""
+
+import os
+import sys
+import argparse
+import threading
+import subprocess
+import image_reader
+import process_guard
+from partition_table import read_partitions, detect_filesystem
+from result_stream import ResultStream, RESULT_JSONL, parse_file_line
+
+# === CẤU HÌNH ===
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ENGINES = {
+    "FAT12": "quet_nhanh_fat.py",
+    "FAT16": "quet_nhanh_fat.py",
+    "FAT32": "quet_nhanh_fat.py",
+    "EXFAT": "quet_nhanh_exfat.py",
+    "NTFS": "quet_nhanh_ntfs.py",
+}
+
+
+def collision_report_path(out, index):
+    """Báo cáo va chạm của phân vùng FAT nằm cạnh file kết quả (--out), tên gắn với file đó."""
+    stem = os.path.splitext(os.path.basename(out))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(out)), f"fat_collisions_{stem}_p{index}.json")
+
+
+def build_command(path, part, sample_args=(), out=RESULT_JSONL):
+    if not path.startswith("\\\\.\\"):
+        path = os.path.abspath(path) # Engine con chạy với cwd=BASE_DIR
+    engine = os.path.join(BASE_DIR, ENGINES[part["filesystem"]])
+    # Mỗi engine con không ghi deleted_files.jsonl (tránh ghi đè lẫn nhau) -> tiến trình cha ghi
+    command = [sys.executable, engine, path, "--offset", str(part["offset"]), "--out", os.devnull, *sample_args]
+    if engine.endswith("quet_nhanh_fat.py"):
+        command += ["--collisions", collision_report_path(out, part["index"])]
+    return command
+
+
+class ProgressBoard:
+    """Gộp tiến độ của các phân vùng, chỉ in khi phần trăm chung thay đổi."""
+
+    def __init__(self, count):
+        self.values = [0] * count
+        self.last = 0 # main() đã in PROGRESS 0
+        self.lock = threading.Lock()
+
+    def update(self, slot, percent):
+        with self.lock:
+            self.values[slot] = percent
+            total = sum(self.values) // len(self.values)
+            if total != self.last:
+                self.last = total
+                print(f"PROGRESS {total}", flush=True)
+
+
+def pump(proc, part, slot, stream, board):
+    """Luồng đọc stdout của một engine con: FILE -> stream chung, PROGRESS -> bảng tiến độ."""
+    for line in proc.stdout:
+        text = line.strip()
+        if not text:
+            continue
+        if text.startswith("PROGRESS"):
+            parts = text.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                board.update(slot, min(int(parts[1]), 99))
+            continue
+        entry = parse_file_line(text)
+        if entry is not None:
+            entry["partition"] = part["index"]
+            stream.emit(entry)
+        else:
+            print(f"[P{part['index']}] {text}", flush=True)
+    proc.wait()
+    board.update(slot, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quét nhanh mọi phân vùng của ổ đĩa / image nguyên ổ")
+    parser.add_argument("path", help="Đường dẫn image nguyên ổ hoặc \\\\.\\PhysicalDriveN")
+    parser.add_argument("--offset", type=int, default=None,
+                        help="Chỉ quét phân vùng bắt đầu tại offset (byte) này")
+    parser.add_argument("--out", default=RESULT_JSONL, help="File JSON Lines ghi kết quả")
+    parser.add_argument("--sample-kb", type=int, default=None,
+                        help="Chuyển cho engine: kích thước cửa sổ mẫu khi chấm điểm (KB), 0 = đọc nguyên file")
+    parser.add_argument("--sample-blocks", type=int, default=None,
+                        help="Chuyển cho engine: số khối mẫu ở giữa file")
+    parser.add_argument("--full-mb", type=int, default=None,
+                        help="Chuyển cho engine: ngưỡng (MB) đọc nguyên file ảnh / Office / PDF")
+    args = parser.parse_args()
+    sample_args = []
+    if args.sample_kb is not None:
+        sample_args += ["--sample-kb", str(args.sample_kb)]
+    if args.sample_blocks is not None:
+        sample_args += ["--sample-blocks", str(args.sample_blocks)]
+    if args.full_mb is not None:
+        sample_args += ["--full-mb", str(args.full_mb)]
+
+    try:
+        with image_reader.open_image(args.path) as f:
+            partitions = read_partitions(f)
+            if args.offset is not None:
+                partitions = [p for p in partitions if p["offset"] == args.offset]
+                if not partitions:
+                    # Không có trong bảng phân vùng (bảng hỏng / phân vùng ẩn) -> nhận diện trực tiếp
+                    fs = detect_filesystem(f.read_at(args.offset, 512))
+                    partitions = [{"index": 0, "offset": args.offset, "size": 0, "scheme": "NONE",
+                                   "type": "", "name": "", "filesystem": fs}]
+    except Exception as e:
+        print(f"[LỖI] Không đọc được bảng phân vùng: {e}", flush=True)
+        return
+
+    for p in partitions:
+        print(f"[i] Phân vùng {p['index']} ({p['scheme']} {p['type']}): offset {p['offset']}, "
+              f"{p['size']} bytes, {p['filesystem'] or 'không rõ'}", flush=True)
+    targets = [p for p in partitions if p["filesystem"] in ENGINES]
+    if not targets:
+        print("[!!!] Không có phân vùng nào có hệ thống tập tin hỗ trợ quét nhanh.", flush=True)
+        return
+
+    process_guard.guard_children()
+    print("PROGRESS 0", flush=True)
+    board = ProgressBoard(len(targets))
+    with ResultStream(args.out) as stream:
+        workers = []
+        for slot, part in enumerate(targets):
+            proc = subprocess.Popen(build_command(args.path, part, sample_args, args.out), stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, text=True, encoding="utf-8",
+                                    errors="replace", cwd=BASE_DIR)
+            t = threading.Thread(target=pump, args=(proc, part, slot, stream, board), daemon=True)
+            t.start()
+            workers.append((proc, t))
+        try:
+            for proc, t in workers:
+                t.join()
+        finally:
+            # Ctrl+C / SIGTERM -> dừng luôn các engine con (Windows: Job object lo phần TerminateProcess)
+            for proc, _ in workers:
+                if proc.poll() is None:
+                    proc.terminate()
+
+    print("PROGRESS 100", flush=True)
+    print(f"Xong! {len(targets)} phân vùng, tìm được {stream.count} file đã xóa.", flush=True)
+
+
+if __name__ == "__main__":
+    main()
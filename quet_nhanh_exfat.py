@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# quet_nhanh_exfat.py
+"""
+QUÉT NHANH exFAT (thẻ SDXC, USB dung lượng lớn)
+  - Boot sector exFAT: vị trí FAT / vùng cluster (cluster heap) / thư mục gốc.
+  - Bitmap cấp phát đọc 1 lần, dùng như bitset: cluster còn trống hay không là phép tra bit O(1).
+  - Entry set: 0x85 (File) + 0xC0 (Stream Extension) + 0xC1 (File Name);
+    entry set đã xóa = cùng cấu trúc nhưng bit InUse (0x80) bị xóa -> 0x05 / 0x40 / 0x41.
+  - Cờ NoFatChain: file nằm liền mạch, bảng FAT không có chuỗi cho file này.
+Kết quả có cùng dạng với quet_nhanh_fat.py (mỗi file phát ngay qua ResultStream).
+"""
+import struct, check, os, sys, image_reader
+from array import array
+from collections import deque
+from result_stream import ResultStream, RESULT_JSONL
+from quet_nhanh_fat import fat_dt_to_str, get_chain, read_chain, chain_runs, needs_integrity, score_integrity, FAT_TYPECODE
+
+EXFAT_BAD = 0xFFFFFFF7
+
+ENTRY_BITMAP = 0x81
+ENTRY_FILE = 0x85
+ENTRY_STREAM = 0xC0
+ENTRY_NAME = 0xC1
+IN_USE = 0x80
+ATTR_DIR = 0x10
+FLAG_NO_FAT_CHAIN = 0x02
+
+# === BOOT SECTOR & layout ===
+def parse_boot(boot):
+    if boot[3:11] != b"EXFAT   ":
+        return None
+    return {
+        "bps": 1 << boot[108],
+        "spc": 1 << boot[109],
+        "fat_offset": struct.unpack("<I", boot[80:84])[0],
+        "fat_length": struct.unpack("<I", boot[84:88])[0],
+        "heap": struct.unpack("<I", boot[88:92])[0],
+        "clusters": struct.unpack("<I", boot[92:96])[0],
+        "root": struct.unpack("<I", boot[96:100])[0],
+    }
+
+def layout(start_lba, bpb):
+    # "data" cùng nghĩa với quet_nhanh_fat -> dùng lại được read_chain / first_sector_of_cluster
+    return {"fat0": start_lba + bpb["fat_offset"], "data": start_lba + bpb["heap"], "start_lba": start_lba}
+
+def cluster_offset(cluster, bpb, lay):
+    return (lay["data"] + (cluster - 2) * bpb["spc"]) * bpb["bps"]
+
+def load_fat(f, bpb, lay):
+    count = bpb["clusters"] + 2
+    fat = array(FAT_TYPECODE)
+    raw = f.read_at(lay["fat0"] * bpb["bps"], count * 4)
+    fat.frombytes(raw[:len(raw) - len(raw) % 4])
+    if sys.byteorder == "big":
+        fat.byteswap()
+    return fat
+
+# === BITMAP CẤP PHÁT (bitset) ===
+# Bit i của bitmap <-> cluster i + 2 (1 = đang dùng)
+def is_allocated(bitmap, cluster):
+    i = cluster - 2
+    if i < 0 or (i >> 3) >= len(bitmap):
+        return True
+    return (bitmap[i >> 3] >> (i & 7)) & 1
+
+def count_allocated(bitmap, first, n):
+    """Số cluster đang dùng trong [first, first + n) -> đếm bit trên một lát bitmap."""
+    lo = first - 2
+    hi = lo + n
+    if lo < 0 or n <= 0:
+        return n
+    if hi > len(bitmap) * 8:
+        return n # Vượt ra ngoài volume -> coi như không còn
+    chunk = int.from_bytes(bitmap[lo >> 3:(hi + 7) >> 3], "little") >> (lo & 7)
+    return bin(chunk & ((1 << n) - 1)).count("1")
+
+# === ĐỌC THƯ MỤC ===
+def file_clusters(fat, first, size, nofatchain, bpb):
+    """Danh sách cluster của file/thư mục: NoFatChain -> liền mạch; ngược lại theo FAT (chuỗi hỏng -> coi là liền mạch)."""
+    cluster_size = bpb["bps"] * bpb["spc"]
+    n = (size + cluster_size - 1) // cluster_size
+    if first < 2 or n == 0:
+        return []
+    if not nofatchain:
+        chain = get_chain(fat, first, bad=EXFAT_BAD)
+        if len(chain) >= n:
+            return chain[:n]
+    return list(range(first, first + n))
+
+def parse_entry_sets(data):
+    """
+    Duyệt các entry 32 byte, trả về dict cho mỗi entry set File (còn dùng hoặc đã xóa).
+    Entry set hỏng (thiếu Stream / Name) bị bỏ qua.
+    """
+    results = []
+    i = 0
+    end = len(data) - len(data) % 32
+    while i < end:
+        etype = data[i]
+        if etype == 0x00:
+            break # Hết thư mục
+        if etype & 0x7F != ENTRY_FILE & 0x7F or i + 64 > end:
+            i += 32
+            continue
+        secondary = data[i + 1]
+        deleted = not (etype & IN_USE)
+        set_end = i + 32 * (secondary + 1)
+        stream = data[i + 32:i + 64]
+        if secondary < 2 or set_end > end or (stream[0] & 0x7F) != (ENTRY_STREAM & 0x7F) \
+                or bool(stream[0] & IN_USE) == deleted:
+            i += 32
+            continue
+
+        attr = struct.unpack("<H", data[i + 4:i + 6])[0]
+        crt, mod, acc = struct.unpack("<III", data[i + 8:i + 20])
+        crt_10ms = data[i + 20]
+        name_len = stream[3]
+        first = struct.unpack("<I", stream[20:24])[0]
+        size = struct.unpack("<Q", stream[24:32])[0]
+
+        parts = []
+        for k in range(i + 64, set_end, 32):
+            if (data[k] & 0x7F) != (ENTRY_NAME & 0x7F):
+                break
+            parts.append(bytes(data[k + 2:k + 32]))
+        name = b"".join(parts).decode("utf-16_le", errors="ignore")[:name_len]
+
+        results.append({
+            "name": name,
+            "deleted": deleted,
+            "attr": attr,
+            "cluster": first,
+            "size": size,
+            "nofatchain": bool(stream[1] & FLAG_NO_FAT_CHAIN),
+            "ext": name.split('.')[-1].lower() if '.' in name else "",
+            "created": fat_dt_to_str(crt >> 16, crt & 0xFFFF, crt_10ms),
+            "modified": fat_dt_to_str(mod >> 16, mod & 0xFFFF),
+            "accessed": fat_dt_to_str(acc >> 16, acc & 0xFFFF),
+        })
+        i = set_end
+    return results
+
+def load_bitmap(f, root_data, fat, bpb, lay):
+    """Tìm entry 0x81 trong thư mục gốc, đọc bitmap cấp phát (bitmap đầu tiên nếu có 2 FAT)."""
+    end = len(root_data) - len(root_data) % 32
+    for i in range(0, end, 32):
+        if root_data[i] == 0x00:
+            break
+        if root_data[i] == ENTRY_BITMAP and not (root_data[i + 1] & 0x01):
+            first = struct.unpack("<I", root_data[i + 20:i + 24])[0]
+            length = struct.unpack("<Q", root_data[i + 24:i + 32])[0]
+            clusters = file_clusters(fat, first, length, False, bpb)
+            return bytes(read_chain(f, clusters, bpb, lay)[:length])
+    return None
+
+# === TRẠNG THÁI FILE ĐÃ XÓA ===
+def check_file_status(bitmap, clusters, size):
+    if size == 0:
+        return "Recoverable (Size 0)"
+    if not clusters:
+        return "Unknown (Bad Cluster)"
+    n = len(clusters)
+    if clusters[-1] - clusters[0] == n - 1:
+        used = count_allocated(bitmap, clusters[0], n)
+    else:
+        used = sum(is_allocated(bitmap, c) for c in clusters)
+    if used == 0:
+        return "Recoverable"
+    elif used == n:
+        return "Overwritten"
+    else:
+        return "Partially Recoverable"
+
+def chain_read_at(f, clusters, bpb, lay):
+    """read_at(offset_trong_file, size) trên chuỗi cluster -> chỉ đọc các cửa sổ mẫu, file phân mảnh vẫn đúng."""
+    cluster_size = bpb["bps"] * bpb["spc"]
+    runs = chain_runs(clusters)
+
+    def read_at(rel, size):
+        parts = []
+        pos = 0
+        for first, count in runs:
+            run_bytes = count * cluster_size
+            if rel < pos + run_bytes and rel + size > pos:
+                lo, hi = max(rel, pos), min(rel + size, pos + run_bytes)
+                parts.append(f.read_at(cluster_offset(first, bpb, lay) + lo - pos, hi - lo))
+            pos += run_bytes
+            if pos >= rel + size:
+                break
+        return b"".join(parts)
+    return read_at
+
+def build_deleted_entry(f, e, fullpath, clusters, bitmap, bpb, lay, budget=check.DEFAULT_BUDGET):
+    offset = cluster_offset(e["cluster"], bpb, lay) if e["cluster"] >= 2 else 0
+    status = check_file_status(bitmap, clusters, e["size"])
+
+    integrity_val = "Unknown"
+    if status == "Recoverable" and needs_integrity(e["size"], budget):
+        try:
+            sample = check.read_sample(chain_read_at(f, clusters, bpb, lay), 0, e["size"], budget, e["ext"])
+            integrity_val = score_integrity(sample, e["ext"])
+        except Exception:
+            integrity_val = "Error"
+    elif e["size"] == 0:
+        integrity_val = "0.00"
+    elif status != "Recoverable":
+        integrity_val = "0.00" # Cluster đã bị ghi đè
+
+    return {
+        "name": e["name"],
+        "type": e["ext"],
+        "size": e["size"],
+        "created": e["created"],
+        "modified": e["modified"],
+        "accessed": e["accessed"],
+        "full_path": fullpath,
+        "offset": offset,
+        "start_cluster": e["cluster"],
+        "status": status,
+        "integrity": integrity_val
+    }
+
+# === SCAN (MỘT LƯỢT, KHÔNG ĐỆ QUY) ===
+def scan_volume(f, bpb, lay, emit=None, on_progress=None, budget=check.DEFAULT_BUDGET):
+    """
+    Duyệt cây thư mục exFAT bằng hàng đợi. Có emit: phát từng file ngay; không có: trả về list.
+    on_progress(percent): số cluster đã duyệt / số cluster đang dùng (đếm bit trên bitmap).
+    budget: ngân sách lấy mẫu khi chấm điểm toàn vẹn (check.make_budget).
+    """
+    fat = load_fat(f, bpb, lay)
+    cluster_size = bpb["bps"] * bpb["spc"]
+
+    root_clusters = get_chain(fat, bpb["root"], bad=EXFAT_BAD)
+    root_data = read_chain(f, root_clusters, bpb, lay)
+    bitmap = load_bitmap(f, root_data, fat, bpb, lay)
+    if bitmap is None:
+        raise IOError("Không tìm thấy Allocation Bitmap")
+
+    used_clusters = bin(int.from_bytes(bitmap, "little")).count("1") or 1
+    done_clusters = 0
+    last_percent = -1
+
+    results = []
+    visited = set()
+    work = deque([(root_clusters, "")])
+    while work:
+        clusters, path = work.popleft()
+        if not clusters or clusters[0] in visited:
+            continue
+        visited.add(clusters[0])
+        try:
+            data = root_data if clusters is root_clusters else read_chain(f, clusters, bpb, lay)
+        except IOError:
+            continue
+        done_clusters += len(clusters)
+
+        for e in parse_entry_sets(data):
+            fullpath = os.path.join(path, e["name"])
+            e_clusters = file_clusters(fat, e["cluster"], e["size"], e["nofatchain"], bpb)
+            is_dir = e["attr"] & ATTR_DIR
+
+            if e["deleted"]:
+                entry = build_deleted_entry(f, e, fullpath, e_clusters, bitmap, bpb, lay, budget)
+                if emit:
+                    emit(entry)
+                else:
+                    results.append(entry)
+            elif not is_dir:
+                done_clusters += (e["size"] + cluster_size - 1) // cluster_size
+
+            if is_dir:
+                work.append((e_clusters, fullpath))
+
+        if on_progress:
+            percent = min(99, int(done_clusters * 100 / used_clusters))
+            if percent > last_percent:
+                on_progress(percent)
+                last_percent = percent
+
+    return results
+
+# === MAIN (CHÍNH) ===
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Quét nhanh exFAT")
+    parser.add_argument("path", help="Đường dẫn image hoặc ổ đĩa exFAT")
+    parser.add_argument("--offset", type=int, default=0,
+                        help="Offset (byte) của phân vùng trong ổ đĩa / image nguyên ổ")
+    parser.add_argument("--out", default=RESULT_JSONL, help="File JSON Lines ghi kết quả")
+    parser.add_argument("--sample-kb", type=int, default=check.SAMPLE_WINDOW // 1024,
+                        help="Kích thước mỗi cửa sổ mẫu khi chấm điểm (KB), 0 = đọc nguyên file")
+    parser.add_argument("--sample-blocks", type=int, default=check.SAMPLE_BLOCKS,
+                        help="Số khối mẫu cách đều ở giữa file")
+    parser.add_argument("--full-mb", type=int, default=check.FULL_READ_MAX // (1024 * 1024),
+                        help="Ảnh / Office / PDF nhỏ hơn ngưỡng này (MB) được đọc nguyên file để phân tích đầy đủ")
+    args = parser.parse_args()
+
+    image_path = args.path
+    try:
+        with image_reader.open_image(image_path) as f:
+            boot = f.read_at(args.offset, 512)
+            bpb = parse_boot(boot) if boot[510:512] == b'\x55\xaa' else None
+            if bpb is None:
+                print("[!!!] Lỗi: Không phải boot sector exFAT hợp lệ.", flush=True)
+                return
+            lay = layout(args.offset // bpb["bps"], bpb)
+
+            print("PROGRESS 0", flush=True)
+            with ResultStream(args.out) as stream:
+                scan_volume(f, bpb, lay, emit=stream.emit,
+                            on_progress=lambda p: print(f"PROGRESS {p}", flush=True),
+                            budget=check.make_budget(args.sample_kb, args.sample_blocks, args.full_mb))
+
+            print("PROGRESS 100", flush=True)
+            print(f"Xong! Tìm được {stream.count} file đã xóa.", flush=True)
+
+    except FileNotFoundError:
+        print(f"[ERROR] Không tìm thấy file: {image_path}", flush=True)
+    except Exception as e:
+        print(f"[ERROR] Lỗi không xác định: {e}", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
-import struct, check, os, json, sys
+import struct, check, os, json, sys, queue, threading, image_reader
+from array import array
+from collections import deque
+from result_stream import ResultStream, RESULT_JSONL
 from datetime import datetime, timedelta
 
-# Tăng giới hạn đệ quy để tránh lỗi với các thư mục quá sâu
-sys.setrecursionlimit(5000)
-
 # === UTILITIES (TIỆN ÍCH) ===
 
 def fat_dt_to_str(fat_date, fat_time, crt_tenth=0):
@@ -25,24 +25,47 @@ def fat_dt_to_str(fat_date, fat_time, crt_tenth=0):
         return ""
 
 def read_sector(f, sector, size=512):
-    f.seek(sector * size)
-    return f.read(size)
+    return f.read_at(sector * size, size)
 
 # === BPB & layout ===
+# FAT32: trường FATSz16 = 0. Còn lại FAT12/16 phân biệt theo số cluster dữ liệu (đặc tả của Microsoft).
+# FAT12/16: thư mục gốc là vùng cố định nằm ngay sau các bảng FAT -> "root" = 0.
 def parse_bpb(boot_sector):
+    bps = struct.unpack("<H", boot_sector[11:13])[0]
+    spc = boot_sector[13]
+    res = struct.unpack("<H", boot_sector[14:16])[0]
+    nfats = boot_sector[16]
+    root_entries = struct.unpack("<H", boot_sector[17:19])[0]
+    spf16 = struct.unpack("<H", boot_sector[22:24])[0]
+    spf = spf16 or struct.unpack("<I", boot_sector[36:40])[0]
+    tot = struct.unpack("<H", boot_sector[19:21])[0] or struct.unpack("<I", boot_sector[32:36])[0]
+    root_sectors = (root_entries * 32 + bps - 1) // bps if bps else 0
+    clusters = (tot - res - nfats * spf - root_sectors) // spc if spc else 0
+    if spf16 == 0:
+        fat_type = 32
+    elif clusters < 4085:
+        fat_type = 12
+    elif clusters < 65525:
+        fat_type = 16
+    else:
+        fat_type = 32
     return {
-        "bps": struct.unpack("<H", boot_sector[11:13])[0],
-        "spc": boot_sector[13],
-        "res": struct.unpack("<H", boot_sector[14:16])[0],
-        "nfats": boot_sector[16],
-        "spf": struct.unpack("<I", boot_sector[36:40])[0],
-        "root": struct.unpack("<I", boot_sector[44:48])[0],
+        "bps": bps,
+        "spc": spc,
+        "res": res,
+        "nfats": nfats,
+        "spf": spf,
+        "root": struct.unpack("<I", boot_sector[44:48])[0] if fat_type == 32 else 0,
+        "tot": tot,
+        "root_sectors": root_sectors,
+        "fat_type": fat_type,
     }
 
 def layout(start_lba, bpb):
     fat0 = start_lba + bpb["res"]
-    data = fat0 + bpb["nfats"] * bpb["spf"]
-    return {"fat0": fat0, "data": data, "start_lba": start_lba}
+    root_dir = fat0 + bpb["nfats"] * bpb["spf"]
+    data = root_dir + bpb["root_sectors"]
+    return {"fat0": fat0, "root_dir": root_dir, "data": data, "start_lba": start_lba}
 
 # === cluster utilities ===
 def first_sector_of_cluster(cluster, bpb, lay):
@@ -50,84 +73,271 @@ def first_sector_of_cluster(cluster, bpb, lay):
 
 def read_cluster(f, cluster, bpb, lay):
     first_sector = first_sector_of_cluster(cluster, bpb, lay)
-    f.seek(first_sector * bpb["bps"])
-    return f.read(bpb["bps"] * bpb["spc"])
-
-def read_fat_entry(f, cluster, bpb, lay):
+    return f.read_at(first_sector * bpb["bps"], bpb["bps"] * bpb["spc"])
+
+# === FAT TABLE (nạp 1 lần vào RAM) ===
+# Cả bảng FAT (spf * bps byte) được đọc MỘT lần thành mảng uint32 -> tra chuỗi cluster
+# chỉ còn là phép lấy chỉ số, không còn mỗi cluster một lần seek + read sector.
+FAT_TYPECODE = "I" if array("I").itemsize == 4 else "L"
+FAT32_HIGH_MASK = bytes(b & 0x0F for b in range(256)) # Bỏ 4 bit cao (dành riêng) của mỗi entry FAT32
+
+def load_fat(f, bpb, lay):
+    raw = bytearray(f.read_at(lay["fat0"] * bpb["bps"], bpb["spf"] * bpb["bps"]))
+    if bpb.get("fat_type", 32) != 32:
+        return load_fat_small(raw, bpb["fat_type"])
+    del raw[len(raw) - len(raw) % 4:]
+    # Byte cao của entry little-endian nằm ở vị trí 3, 7, 11... -> che bằng translate (chạy bằng C)
+    raw[3::4] = raw[3::4].translate(FAT32_HIGH_MASK)
+    fat = array(FAT_TYPECODE)
+    fat.frombytes(raw)
+    if sys.byteorder == "big":
+        fat.byteswap()
+    return fat
+
+def load_fat_small(raw, fat_type):
+    """
+    FAT12/16 -> cùng dạng mảng với FAT32: giá trị đặc biệt (dành riêng / cluster lỗi / EOC) được
+    dời lên vùng tương ứng của FAT32 để get_chain dùng chung một bộ hằng số.
+    """
+    if fat_type == 16:
+        values = array("H")
+        values.frombytes(bytes(raw[:len(raw) - len(raw) % 2]))
+        if sys.byteorder == "big":
+            values.byteswap()
+        reserved = 0xFFF0
+    else:
+        # FAT12: 2 entry nằm gọn trong 3 byte
+        values = []
+        for n in range(len(raw) * 2 // 3):
+            off = n * 3 // 2
+            v = raw[off] | (raw[off + 1] << 8)
+            values.append(v >> 4 if n & 1 else v & 0x0FFF)
+        reserved = 0x0FF0
+    shift = FAT32_RESERVED - reserved
+    return array(FAT_TYPECODE, (v + shift if v >= reserved else v for v in values))
+
+def read_fat_entry(fat, cluster):
     if cluster < 2:
         return 0xFFFFFFFF
-    fat_offset = cluster * 4
-    fat_sector = lay["fat0"] + (fat_offset // bpb["bps"])
-    offset_in_sector = fat_offset % bpb["bps"]
-    try:
-        sec = read_sector(f, fat_sector, bpb["bps"])
-        entry = struct.unpack("<I", sec[offset_in_sector:offset_in_sector+4])[0]
-        return entry & 0x0FFFFFFF
-    except (IOError, struct.error):
+    if cluster >= len(fat):
         return None
-
-# === parse directory entries ===
-def parse_directory_entries(cluster_data):
-    entries = []
-    lfn_parts = []
-    for i in range(0, len(cluster_data), 32):
-        e = cluster_data[i:i+32]
-        if len(e) < 32 or e[0] == 0x00:
+    return fat[cluster]
+
+# === BẢN ĐỒ CẤP PHÁT (dựng 1 lần từ FAT trong RAM) ===
+# 1 byte / cluster: 1 = đang dùng (entry FAT khác 0), 0 = trống.
+# Đếm cluster đang dùng trong một đoạn = bytes.count() trên lát (popcount chạy bằng C),
+# tìm các đoạn bị chiếm = bytes.find() -> không còn lặp từng cluster bằng Python.
+NONZERO_TO_ONE = b"\x00" + b"\x01" * 255
+
+def build_alloc_map(fat):
+    raw = fat.tobytes()
+    width = fat.itemsize
+    # OR các byte của mỗi entry (qua số nguyên lớn) -> byte khác 0 <=> entry khác 0
+    nz = 0
+    for k in range(width):
+        nz |= int.from_bytes(raw[k::width], "little")
+    return nz.to_bytes(len(fat), "little").translate(NONZERO_TO_ONE)
+
+def allocated_runs(alloc, first, n):
+    """Các đoạn cluster đang dùng [(đầu, cuối), ...] nằm trong [first, first + n)."""
+    runs = []
+    end = min(first + n, len(alloc))
+    pos = alloc.find(1, first, end)
+    while pos != -1:
+        stop = alloc.find(0, pos, end)
+        if stop == -1:
+            stop = end
+        runs.append((pos, stop - 1))
+        pos = alloc.find(1, stop, end)
+    return runs
+
+def find_collisions(alloc, fat, first, n):
+    """
+    Các đoạn cluster của file đã xóa đang bị file/thư mục khác chiếm.
+    Đoạn bị cắt ở chỗ cluster trước không trỏ sang cluster sau trong FAT -> mỗi đoạn thuộc đúng một chuỗi;
+    chủ sở hữu được tìm một lần sau khi quét (resolve_owners).
+    Cluster lỗi / giá trị dành riêng không thuộc file nào -> không tính là va chạm.
+    """
+    collisions = []
+
+    def add(a, b):
+        collisions.append({"clusters": [a, b]})
+
+    for a, b in allocated_runs(alloc, first, n):
+        start = None
+        for c in range(a, b + 1):
+            if FAT32_RESERVED <= fat[c] < FAT32_EOC:
+                if start is not None:
+                    add(start, c - 1)
+                    start = None
+            elif start is None:
+                start = c
+            elif fat[c - 1] != c:
+                add(start, c - 1)
+                start = c
+        if start is not None:
+            add(start, b)
+    return collisions
+
+# === CHUỖI CLUSTER (cluster chain) ===
+FAT32_EOC = 0x0FFFFFF8 # >= giá trị này: hết chuỗi
+FAT32_BAD = 0x0FFFFFF7
+FAT32_RESERVED = 0x0FFFFFF0 # 0x0FFFFFF0..0x0FFFFFF6: giá trị dành riêng, không phải cluster kế
+
+def get_chain(fat, start, cache=None, bad=FAT32_BAD):
+    """
+    Danh sách cluster của chuỗi bắt đầu từ `start` (dừng ở EOC / cluster lỗi / vòng lặp).
+    Thư mục đã xóa có entry FAT = 0 -> chỉ còn cluster đầu.
+    cache: dict {start: chain} dùng chung trong một lần quét.
+    bad: giá trị "cluster lỗi" (exFAT dùng 0xFFFFFFF7).
+    """
+    if cache is not None and start in cache:
+        return cache[start]
+    chain = []
+    seen = set()
+    c = start
+    while 2 <= c < len(fat) and c not in seen:
+        chain.append(c)
+        seen.add(c)
+        nxt = fat[c]
+        if nxt == 0 or nxt >= bad:
             break
-        attr = e[11]
-        if attr == 0x0F:
-            name_bytes = e[1:11] + e[14:26] + e[28:32]
-            lfn_part = name_bytes.decode('utf-16_le', errors='ignore')
-            lfn_parts.insert(0, lfn_part)
-            continue
-        deleted = (e[0] == 0xE5)
-        name_sde = e[0:8].decode("ascii", errors="replace").strip()
-        ext_sde = e[8:11].decode("ascii", errors="replace").strip()
-        if lfn_parts:
-            fullname = "".join(lfn_parts).split('\x00', 1)[0]
-            lfn_parts = []
+        c = nxt
+    if cache is not None:
+        cache[start] = chain
+    return chain
+
+def deleted_dir_chain(fat, alloc, cluster):
+    """
+    Chuỗi cluster của thư mục ĐÃ XÓA. Không đi theo FAT sống khi cluster đầu đã bị cấp lại
+    (chuỗi đó là của file khác) -> chỉ đọc cluster đầu như bản gốc.
+    Cluster đầu còn trống: đi theo chuỗi nhưng dừng trước cluster đầu tiên đang được dùng.
+    """
+    if alloc[cluster]:
+        return [cluster]
+    chain = get_chain(fat, cluster)
+    for i in range(1, len(chain)):
+        if alloc[chain[i]]:
+            return chain[:i]
+    return chain
+
+def chain_runs(chain):
+    """Gộp chuỗi cluster thành các đoạn liên tiếp [(cluster_đầu, số_cluster), ...]."""
+    runs = []
+    for c in chain:
+        if runs and runs[-1][0] + runs[-1][1] == c:
+            runs[-1][1] += 1
         else:
+            runs.append([c, 1])
+    return [(first, count) for first, count in runs]
+
+def read_chain(f, chain, bpb, lay):
+    """Đọc cả chuỗi cluster: mỗi đoạn liên tiếp chỉ một lần đọc lớn."""
+    cluster_size = bpb["bps"] * bpb["spc"]
+    parts = []
+    for first, count in chain_runs(chain):
+        offset = first_sector_of_cluster(first, bpb, lay) * bpb["bps"]
+        parts.append(f.read_at(offset, count * cluster_size))
+    return b"".join(parts)
+
+def read_directory(f, cluster, bpb, lay, fat, cache=None):
+    """Dữ liệu đầy đủ của thư mục (mọi cluster trong chuỗi, không chỉ cluster đầu)."""
+    return read_chain(f, get_chain(fat, cluster, cache), bpb, lay)
+
+# === parse directory entries (theo lô) ===
+# Một entry 32 byte: name(11) attr ntres crt_tenth crt_time crt_date lst_acc_date clus_hi
+#                    lst_wrt_time lst_wrt_date clus_lo size
+DIR_ENTRY = struct.Struct("<11s3B7HI")
+ATTR_LFN = 0x0F
+ATTR_DIR = 0x10
+
+def parse_directory_columns(data):
+    """
+    Giải mã cả vùng dữ liệu thư mục MỘT lần (struct.iter_unpack) thành các cột song song.
+    Dừng ở entry đầu tiên có byte 0 = 0x00 (hết thư mục). Trả về None nếu không có entry.
+    """
+    count = len(data) // 32
+    firsts = bytes(data[0:count * 32:32]) # Byte đầu của mọi entry (0x00 = hết, 0xE5 = đã xóa)
+    end = firsts.find(b"\x00")
+    if end != -1:
+        count = end
+    if count == 0:
+        return None
+    cols = list(zip(*DIR_ENTRY.iter_unpack(data[:count * 32])))
+    return {
+        "count": count,
+        "first": firsts[:count],
+        "raw_name": cols[0],
+        "attr": cols[1],
+        "crt_tenth": cols[3],
+        "crt_time": cols[4],
+        "crt_date": cols[5],
+        "lst_acc_date": cols[6],
+        "clus_hi": cols[7],
+        "lst_wrt_time": cols[8],
+        "lst_wrt_date": cols[9],
+        "clus_lo": cols[10],
+        "size": cols[11],
+    }
+
+def lfn_name(data, cols, i):
+    """Ghép tên dài từ các entry LFN nằm ngay trước entry i (entry gần nhất là phần đầu tên)."""
+    parts = []
+    j = i - 1
+    attrs = cols["attr"]
+    while j >= 0 and attrs[j] == ATTR_LFN:
+        e = data[j * 32:j * 32 + 32]
+        parts.append(bytes(e[1:11] + e[14:26] + e[28:32]).decode('utf-16_le', errors='ignore'))
+        j -= 1
+    return "".join(parts).split('\x00', 1)[0] if parts else None
+
+def build_entries(data, cols, indices):
+    """Dựng dict entry (kèm tên) chỉ cho các chỉ số đã lọc."""
+    entries = []
+    for i in indices:
+        raw = cols["raw_name"][i]
+        deleted = (cols["first"][i] == 0xE5)
+        name_sde = raw[0:8].decode("ascii", errors="replace").strip()
+        ext_sde = raw[8:11].decode("ascii", errors="replace").strip()
+        fullname = lfn_name(data, cols, i)
+        if fullname is None:
             if deleted:
                 fullname = f"?{name_sde[1:]}.{ext_sde}" if ext_sde else f"?{name_sde[1:]}"
             else:
                 fullname = f"{name_sde}.{ext_sde}" if ext_sde else name_sde
-        clus_hi = struct.unpack("<H", e[20:22])[0]
-        clus_low = struct.unpack("<H", e[26:28])[0]
-        cluster = (clus_hi << 16) | clus_low
-        size = struct.unpack("<I", e[28:32])[0]
-        crt_tenth = e[13]
-        crt_time = struct.unpack("<H", e[14:16])[0]
-        crt_date = struct.unpack("<H", e[16:18])[0]
-        lst_acc_date = struct.unpack("<H", e[18:20])[0]
-        lst_wrt_time = struct.unpack("<H", e[22:24])[0]
-        lst_wrt_date = struct.unpack("<H", e[24:26])[0]
-        if fullname not in [".", ".."]:
-            entries.append({
-                "name": fullname,
-                "cluster": cluster,
-                "size": size,
-                "deleted": deleted,
-                "attr": attr,
-                "ext": fullname.split('.')[-1].lower() if '.' in fullname else ext_sde.lower(),
-                "crt_tenth": crt_tenth, "crt_time": crt_time, "crt_date": crt_date,
-                "lst_acc_date": lst_acc_date, "lst_wrt_time": lst_wrt_time, "lst_wrt_date": lst_wrt_date,
-            })
+        if fullname in [".", ".."]:
+            continue
+        entries.append({
+            "name": fullname,
+            "cluster": (cols["clus_hi"][i] << 16) | cols["clus_lo"][i],
+            "size": cols["size"][i],
+            "deleted": deleted,
+            "attr": cols["attr"][i],
+            "ext": fullname.split('.')[-1].lower() if '.' in fullname else ext_sde.lower(),
+            "crt_tenth": cols["crt_tenth"][i], "crt_time": cols["crt_time"][i], "crt_date": cols["crt_date"][i],
+            "lst_acc_date": cols["lst_acc_date"][i], "lst_wrt_time": cols["lst_wrt_time"][i],
+            "lst_wrt_date": cols["lst_wrt_date"][i],
+        })
     return entries
 
+def parse_directory_entries(cluster_data):
+    """Mọi entry (trừ LFN, '.', '..') dạng dict."""
+    cols = parse_directory_columns(cluster_data)
+    if cols is None:
+        return []
+    attrs = cols["attr"]
+    return build_entries(cluster_data, cols, [i for i in range(cols["count"]) if attrs[i] != ATTR_LFN])
+
 # === quét & báo cáo ===
-def check_file_status(f, start_cluster, size, bpb, lay):
+def check_file_status(alloc, start_cluster, size, bpb):
     cluster_size = bpb["bps"] * bpb["spc"]
     needed_clusters = (size + cluster_size - 1) // cluster_size
     if needed_clusters == 0:
         return "Recoverable (Size 0)"
-    free_cnt = 0
-    for i in range(needed_clusters):
-        current_cluster = start_cluster + i
-        val = read_fat_entry(f, current_cluster, bpb, lay)
-        if val is None:
-            return "Unknown (FAT Read Error)"
-        if val == 0:
-            free_cnt += 1
+    if start_cluster < 2 or start_cluster + needed_clusters > len(alloc):
+        return "Unknown (FAT Read Error)"
+    # Đếm cluster đang dùng trên bản đồ cấp phát (một lệnh count cho cả đoạn)
+    free_cnt = needed_clusters - alloc.count(1, start_cluster, start_cluster + needed_clusters)
     if free_cnt == needed_clusters:
         return "Recoverable"
     elif free_cnt == 0:
@@ -135,169 +345,519 @@ def check_file_status(f, start_cluster, size, bpb, lay):
     else:
         return "Partially Recoverable"
 
-# === COUNT TOTAL ENTRIES PHASE (ĐỆ QUY) ===
-# === COUNT TOTAL ENTRIES PHASE (ĐỆ QUY) ===
-def count_entries(f, cluster, bpb, lay, visited=None):
-    if visited is None:
-        visited = set()
+# === CHẤM ĐIỂM TOÀN VẸN ===
+# Mặc định chỉ đọc mẫu (header + footer + K khối, xem check.sample_windows) -> file lớn vẫn được chấm.
+# budget = None: đọc nguyên file như cũ, file >= 50MB bỏ qua để tránh lag.
+INTEGRITY_MAX_SIZE = 50 * 1024 * 1024
+
+def needs_integrity(size, budget):
+    return size > 0 and (budget is not None or size < INTEGRITY_MAX_SIZE)
+
+def score_integrity(sample, ext):
+    """sample: kết quả check.read_sample (hoặc mẫu dựng từ các lần đọc gộp)."""
     try:
-        if cluster in visited or cluster < 2:
-            return 0
-        visited.add(cluster)
-        data = read_cluster(f, cluster, bpb, lay)
+        score = check.analyze_sample_integrity(sample, ext)
+        return "N/A" if score is None else f"{score:.2f}"
     except Exception:
-        return 0
-
-    entries = parse_directory_entries(data)
-    total = len(entries)
-    for e in entries:
-        # [SỬA] Cho phép đếm cả trong thư mục ĐÃ XÓA (miễn là là thư mục và có cluster hợp lệ)
-        if (e["attr"] & 0x10) and e["cluster"] > 1:
-            total += count_entries(f, e["cluster"], bpb, lay, visited)
-    return total
-
-# === SCAN (sử dụng progress_obj với total cố định) ===
-def scan_directory(f, cluster, bpb, lay, path="", progress_obj=None, visited=None):
-    """Quét thư mục đệ quy và gửi tiến độ. progress_obj phải có keys: done, total (total cố định)."""
-    if progress_obj is None:
-        progress_obj = {"done": 0, "total": 0}
+        return "Error"
+
+# === THÔNG TIN 1 FILE ĐÃ XÓA ===
+def build_deleted_entry(f, e, fullpath, bpb, lay, fat, alloc, defer_integrity=False,
+                        budget=check.DEFAULT_BUDGET):
+    """defer_integrity=True: file cần chấm điểm trả về integrity=None (IntegrityPool chấm sau)."""
+    offset = first_sector_of_cluster(e["cluster"], bpb, lay) * bpb["bps"] if e["cluster"] >= 2 else 0
+    created_str = fat_dt_to_str(e["crt_date"], e["crt_time"], e["crt_tenth"])
+    modified_str = fat_dt_to_str(e["lst_wrt_date"], e["lst_wrt_time"])
+    accessed_str = fat_dt_to_str(e["lst_acc_date"], 0)
+
+    status = check_file_status(alloc, e["cluster"], e["size"], bpb)
+
+    # Đoạn cluster đang bị file khác chiếm (khôi phục sẽ lấy nhầm dữ liệu của chúng)
+    collisions = []
+    if status in ("Overwritten", "Partially Recoverable"):
+        cluster_size = bpb["bps"] * bpb["spc"]
+        needed = (e["size"] + cluster_size - 1) // cluster_size
+        collisions = find_collisions(alloc, fat, e["cluster"], needed)
+
+    integrity_val = "Unknown"
+
+    # Chỉ check integrity nếu trạng thái cluster còn tốt ("Recoverable")
+    if status == "Recoverable" and needs_integrity(e["size"], budget):
+        if defer_integrity:
+            integrity_val = None
+        else:
+            try:
+                sample = check.read_sample(f.read_at, offset, e["size"], budget, e["ext"]) # mmap: chỉ là slice
+                integrity_val = score_integrity(sample, e["ext"])
+            except Exception:
+                integrity_val = "Error"
+    elif e["size"] == 0:
+        integrity_val = "0.00"
+    elif status != "Recoverable":
+        integrity_val = "0.00" # Cluster đã bị ghi đè
+
+    return {
+        "name": e["name"],
+        "type": e["ext"],
+        "size": e["size"],
+        "created": created_str,
+        "modified": modified_str,
+        "accessed": accessed_str,
+        "full_path": fullpath,
+        "offset": offset,
+        "start_cluster": e["cluster"],
+        "status": status,
+        "integrity": integrity_val,
+        "collisions": collisions
+    }
+
+# === POOL CHẤM ĐIỂM (đọc tuần tự theo offset, chấm song song) ===
+INTEGRITY_BATCH = 256                    # Số file tối đa mỗi lô
+INTEGRITY_BATCH_BYTES = 64 * 1024 * 1024 # Tổng dữ liệu (mẫu) tối đa mỗi lô
+COALESCE_GAP = 1024 * 1024               # Hai file cách nhau <= 1MB -> gộp chung một lần đọc
+INTEGRITY_QUEUE_SIZE = 64                # Số file đã đọc tối đa chờ chấm điểm
+# Luồng chấm điểm chỉ để chồng I/O (đọc mẫu, ghi sink) với luồng duyệt, KHÔNG song song hóa việc chấm:
+# check.* là Python thuần nên giữ GIL, thêm luồng không chấm nhanh hơn (chỉ phần C nhả GIL như zlib/Pillow).
+# Cần chấm song song thật thì phải dùng tiến trình như quet_sau.carve_parallel.
+INTEGRITY_THREADS = 2
+
+def coalesce_reads(items, gap=COALESCE_GAP, limit=INTEGRITY_BATCH_BYTES):
+    """
+    items: [(offset, size, ...)] đã sắp theo offset.
+    Trả về [(start, end, [item...])]: các file gần nhau được gộp thành một đoạn đọc liên tục.
+    """
+    groups = []
+    for item in items:
+        offset, size = item[0], item[1]
+        if groups and offset - groups[-1][1] <= gap and offset + size - groups[-1][0] <= limit:
+            start, end, members = groups[-1]
+            groups[-1] = (start, max(end, offset + size), members)
+            members.append(item)
+        else:
+            groups.append((offset, offset + size, [item]))
+    return groups
+
+class IntegrityPool:
+    """
+    Chấm điểm toàn vẹn tách khỏi luồng duyệt thư mục.
+    submit(entry, sink): gom các cửa sổ mẫu (check.sample_windows) vào lô;
+    đủ lô -> luồng đọc sắp theo offset, đọc gộp (coalesce_reads),
+    các luồng chấm điểm gọi check.analyze_file_integrity rồi sink(entry) (tuần tự, có khóa).
+    Các luồng chỉ chồng I/O với luồng duyệt; việc chấm vẫn bị GIL tuần tự hóa (xem INTEGRITY_THREADS).
+    Luồng đọc dùng handle riêng (ổ đĩa thật đọc bằng seek/read, không dùng chung được với luồng duyệt).
+    Lỗi trong luồng đọc / chấm điểm không làm chết luồng (hàng đợi có giới hạn sẽ treo submit / close):
+    entry bị lỗi nhận integrity = "Error", lỗi đầu tiên được giữ lại và ném ra ở close().
+    close() chấm nốt phần còn lại và chờ tất cả xong.
+    """
+
+    def __init__(self, path, budget=check.DEFAULT_BUDGET, threads=INTEGRITY_THREADS):
+        self.reader = image_reader.open_image(path)
+        self.budget = budget
+        self.pending = []
+        self.pending_bytes = 0
+        self.batches = queue.Queue(maxsize=2)
+        self.jobs = queue.Queue(maxsize=INTEGRITY_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.error = None
+        self.read_thread = threading.Thread(target=self._read_stage, daemon=True)
+        self.threads = [threading.Thread(target=self._scorer, daemon=True) for _ in range(max(1, threads))]
+        self.read_thread.start()
+        for t in self.threads:
+            t.start()
+
+    def submit(self, entry, sink):
+        windows = check.sample_windows(entry["size"], self.budget, entry["type"])
+        self.pending.append((entry, sink, windows))
+        self.pending_bytes += sum(n for _, n in windows)
+        if len(self.pending) >= INTEGRITY_BATCH or self.pending_bytes >= INTEGRITY_BATCH_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.batches.put(self.pending)
+            self.pending = []
+            self.pending_bytes = 0
+
+    def _fail(self, e):
+        with self.lock:
+            if self.error is None:
+                self.error = e
+
+    def _read_batch(self, batch):
+        """Đọc gộp mọi cửa sổ của lô -> [mẫu hoặc None (đọc lỗi)] theo thứ tự entry."""
+        # Mọi cửa sổ của cả lô, sắp theo offset tuyệt đối -> đọc tuần tự
+        reads = sorted((entry["offset"] + rel, n, slot, rel)
+                       for slot, (entry, _, windows) in enumerate(batch) for rel, n in windows)
+        parts = [[] for _ in batch]
+        for start, end, members in coalesce_reads(reads):
+            start, end = check.align_range(start, end - start) # Ổ đĩa thô: đọc theo biên sector
+            try:
+                blob = self.reader.read_at(start, end - start)
+            except Exception:
+                blob = None
+            for offset, n, slot, rel in members:
+                parts[slot].append((rel, blob[offset - start:offset - start + n] if blob is not None else None))
+        samples = []
+        for (entry, _, _), windows in zip(batch, parts):
+            windows.sort(key=lambda w: w[0])
+            ok = all(data is not None for _, data in windows)
+            samples.append({"size": entry["size"], "windows": windows} if ok else None)
+        return samples
+
+    def _read_stage(self):
+        try:
+            while True:
+                batch = self.batches.get()
+                if batch is None:
+                    return
+                try:
+                    samples = self._read_batch(batch)
+                except Exception as e:
+                    self._fail(e)
+                    samples = [None] * len(batch) # Cả lô chấm "Error" nhưng vẫn được phát
+                for (entry, sink, _), sample in zip(batch, samples):
+                    self.jobs.put((entry, sink, sample))
+        finally:
+            for _ in self.threads:
+                self.jobs.put(None)
+
+    def _scorer(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            entry, sink, sample = job
+            try:
+                entry["integrity"] = score_integrity(sample, entry["type"]) if sample is not None else "Error"
+                with self.lock:
+                    sink(entry)
+            except Exception as e:
+                entry["integrity"] = "Error"
+                self._fail(e) # Vẫn tiếp tục lấy job -> hàng đợi không bao giờ bị bỏ đầy
+
+    def close(self):
+        self.flush()
+        self.batches.put(None)
+        self.read_thread.join()
+        for t in self.threads:
+            t.join()
+        self.reader.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# === SCAN (MỘT LƯỢT, KHÔNG ĐỆ QUY) ===
+def data_cluster_count(bpb, lay):
+    """Tổng số cluster vùng dữ liệu (tính từ BPB)."""
+    data_sectors = bpb["tot"] - (lay["data"] - lay["start_lba"])
+    return max(0, data_sectors // bpb["spc"]) if bpb["spc"] else 0
+
+def scan_directory(f, cluster, bpb, lay, path="", emit=None, fat=None, chains=None, on_progress=None, visited=None,
+                   alloc=None, report=None, pool=None, budget=check.DEFAULT_BUDGET):
+    """
+    Duyệt cây thư mục MỘT lượt bằng hàng đợi (không đệ quy -> cây sâu không tràn stack).
+    Có emit: phát từng file ngay khi tìm thấy (không gom vào list). Không có: trả về list kết quả.
+    on_progress(percent): tiến độ = số cluster đã duyệt (thư mục + dữ liệu các entry) / số cluster đang dùng.
+    visited: set các cluster thư mục đã đọc (truyền vào để dùng chung với sweep_orphan_dirs).
+    alloc: bản đồ cấp phát (build_alloc_map). report: dict gom dữ liệu cho báo cáo va chạm (new_report).
+    pool: IntegrityPool -> file cần chấm điểm được phát sau khi pool chấm xong (luồng duyệt không chờ).
+    budget: ngân sách lấy mẫu khi chấm điểm ngay trên luồng duyệt (không có pool).
+    Không có emit mà có pool: phải đóng pool trước khi dùng list kết quả.
+    """
+    if fat is None:
+        fat = load_fat(f, bpb, lay)
+    if alloc is None:
+        alloc = build_alloc_map(fat)
+    if report is None:
+        report = new_report()
+    if chains is None:
+        chains = {}
     if visited is None:
         visited = set()
-    try:
-        if cluster in visited or cluster < 2:
-            return []
-        visited.add(cluster)
-        data = read_cluster(f, cluster, bpb, lay)
-    except IOError:
-        return []
 
-    entries = parse_directory_entries(data)
+    cluster_size = bpb["bps"] * bpb["spc"]
+    total_clusters = data_cluster_count(bpb, lay)
+    # Cluster đang dùng (đếm trên bản đồ cấp phát) -> mẫu số của tiến độ
+    used_clusters = alloc.count(1, 2, total_clusters + 2)
+    if used_clusters <= 0:
+        used_clusters = 1
+    done_clusters = 0
+    last_percent = -1
+
     results = []
-    for e in entries:
-        fullpath = os.path.join(path, e["name"])
-
-        # Cập nhật done (chỉ done tăng, total KHÔNG đổi trong lúc scan)
-        progress_obj["done"] += 1
-        if progress_obj.get("total", 0) > 0:
-            # Chỉ in progress khi thay đổi đáng kể để tránh lag console (optional, but good for performance)
-            if progress_obj["done"] % 10 == 0 or progress_obj["done"] == progress_obj["total"]:
-                percent = int((progress_obj["done"] / progress_obj["total"]) * 100)
-                # In progress dưới dạng integer để dễ parse ở GUI
-                print(f"PROGRESS {int(percent)}", flush=True)
-
-        offset = first_sector_of_cluster(e["cluster"], bpb, lay) * bpb["bps"] if e["cluster"] >= 2 else 0
-        created_str = fat_dt_to_str(e["crt_date"], e["crt_time"], e["crt_tenth"])
-        modified_str = fat_dt_to_str(e["lst_wrt_date"], e["lst_wrt_time"])
-        accessed_str = fat_dt_to_str(e["lst_acc_date"], 0)
-
-        if e["deleted"] and e["cluster"] > 1:
-            status = check_file_status(f, e["cluster"], e["size"], bpb, lay)
-            
-            # === [ĐOẠN CODE MỚI BẮT ĐẦU] ===
-            integrity_val = "Unknown"
-            
-            # Chỉ check integrity nếu trạng thái cluster còn tốt ("Recoverable")
-            # và kích thước file không quá lớn (<50MB) để tránh lag
-            if status == "Recoverable" and 0 < e["size"] < 50 * 1024 * 1024:
-                try:
-                    # Lưu vị trí con trỏ hiện tại
-                    current_pos = f.tell()
-                    
-                    # Tính offset của file trên ổ đĩa
-                    # offset đã được tính ở dòng trên: offset = first_sector... * bps
-                    
-                    f.seek(offset)
-                    raw_data = f.read(e["size"]) # Đọc dữ liệu lên RAM
-                    
-                    f.seek(current_pos) # Trả con trỏ về chỗ cũ
-                    
-                    # Gọi hàm check
-                    score = check.analyze_file_integrity(raw_data, e["ext"])
-                    
-                    if score is None:
-                        integrity_val = "N/A"
-                    else:
-                        integrity_val = f"{score:.2f}"
-                        
-                except Exception:
-                    integrity_val = "Error"
-            elif e["size"] == 0:
-                integrity_val = "0.00"
-            elif status != "Recoverable":
-                integrity_val = "0.00" # Cluster đã bị ghi đè
-            # === [ĐOẠN CODE MỚI KẾT THÚC] ===
-
-            enriched_entry = {
-                "name": e["name"],
-                "type": e["ext"],
-                "size": e["size"],
-                "created": created_str,
-                "modified": modified_str,
-                "accessed": accessed_str,
-                "full_path": fullpath,
-                "offset": offset,
-                "start_cluster": e["cluster"],
-                "status": status,
-                "integrity": integrity_val # <--- Thêm trường này vào JSON
-            }
-            results.append(enriched_entry)
-
-        if (e["attr"] & 0x10) and e["cluster"] > 1:
-            # Nếu là thư mục xóa, tên file sẽ có dấu ? hoặc ký tự lạ, nhưng vẫn scan được bên trong
-            results.extend(scan_directory(f, e["cluster"], bpb, lay, fullpath, progress_obj, visited))
+    sink = emit or results.append
+    work = deque([(cluster, path, False)])
+    seen_deleted = set() # Thư mục đã xóa có cluster đầu bị cấp lại: không đưa vào visited
+    while work:
+        cluster, path, deleted_dir = work.popleft()
+        if cluster == 0 and bpb.get("root_sectors"):
+            # Thư mục gốc cố định của FAT12/16 (không thuộc vùng cluster)
+            if cluster in visited:
+                continue
+            visited.add(cluster)
+            chain = []
+            data = f.read_at(lay["root_dir"] * bpb["bps"], bpb["root_sectors"] * bpb["bps"])
+        else:
+            if cluster in visited or cluster in seen_deleted or cluster < 2 or cluster >= len(alloc):
+                continue
+            reused = deleted_dir and alloc[cluster]
+            try:
+                if deleted_dir:
+                    chain = deleted_dir_chain(fat, alloc, cluster)
+                else:
+                    chain = get_chain(fat, cluster, chains)
+                data = read_chain(f, chain, bpb, lay)
+            except IOError:
+                continue
+            if reused:
+                # Cluster đang thuộc file/thư mục khác -> để lần duyệt thư mục sống vẫn đọc được nó
+                seen_deleted.add(cluster)
+                chain = []
+            else:
+                visited.add(cluster)
+        visited.update(chain)
+        if cluster not in seen_deleted:
+            report["dirs"][cluster] = path
+        done_clusters += len(chain)
+
+        cols = parse_directory_columns(data)
+        if cols is None:
+            continue
+        attrs, firsts, sizes = cols["attr"], cols["first"], cols["size"]
+
+        # File còn sống: chỉ cần kích thước cho tiến độ (không dựng tên)
+        for attr, first, size in zip(attrs, firsts, sizes):
+            if attr != ATTR_LFN and first != 0xE5 and not attr & ATTR_DIR:
+                done_clusters += (size + cluster_size - 1) // cluster_size
+
+        # Chỉ dựng tên + dict cho entry đã xóa hoặc thư mục
+        picked = [i for i in range(cols["count"])
+                  if attrs[i] != ATTR_LFN and (firsts[i] == 0xE5 or attrs[i] & ATTR_DIR)]
+        for e in build_entries(data, cols, picked):
+            fullpath = os.path.join(path, e["name"])
+            is_dir = (e["attr"] & ATTR_DIR) and e["cluster"] > 1
+
+            if e["deleted"] and e["cluster"] > 1:
+                entry = build_deleted_entry(f, e, fullpath, bpb, lay, fat, alloc,
+                                            defer_integrity=pool is not None,
+                                            budget=pool.budget if pool is not None else budget)
+                for col in entry["collisions"]:
+                    report["collisions"].append(dict(col, file=fullpath))
+                if entry["integrity"] is None:
+                    pool.submit(entry, sink)
+                else:
+                    sink(entry)
+
+            if is_dir:
+                # Nếu là thư mục xóa, tên file sẽ có dấu ? hoặc ký tự lạ, nhưng vẫn scan được bên trong
+                work.append((e["cluster"], fullpath, e["deleted"]))
+
+        if on_progress:
+            percent = min(99, int(done_clusters * 100 / used_clusters))
+            if percent > last_percent:
+                on_progress(percent)
+                last_percent = percent
 
     return results
 
+# === BÁO CÁO VA CHẠM (file đã xóa <-> file đang dùng) ===
+COLLISION_REPORT = "fat_collisions.json"
+
+def new_report():
+    # dirs: {cluster thư mục: đường dẫn}; collisions: các đoạn bị chiếm
+    return {"dirs": {}, "collisions": []}
+
+def resolve_owners(f, bpb, lay, fat, chains, report):
+    """
+    Tìm file/thư mục đang dùng sở hữu mỗi đoạn bị chiếm (chỉ chạy khi có va chạm).
+    Đọc lại các thư mục đã duyệt, đi theo chuỗi cluster của từng entry đang dùng (mỗi chuỗi một lần)
+    tới khi gặp đủ cluster đầu các đoạn; chỉ dựng tên cho entry trúng.
+    """
+    wanted = {c["clusters"][0] for c in report["collisions"]}
+    found = {} # cluster đầu đoạn -> (start cluster chủ, đường dẫn)
+
+    def claim(start, chain, path):
+        for c in chain:
+            if c in wanted and c not in found:
+                found[c] = (start, path)
+
+    for dir_cluster, path in report["dirs"].items():
+        if len(found) == len(wanted):
+            break
+        if dir_cluster == 0:
+            data = f.read_at(lay["root_dir"] * bpb["bps"], bpb["root_sectors"] * bpb["bps"])
+        else:
+            chain = get_chain(fat, dir_cluster, chains)
+            if fat[dir_cluster] != 0: # Thư mục đã xóa (cluster đầu trống) không sở hữu gì
+                claim(dir_cluster, chain, path)
+            data = read_chain(f, chain, bpb, lay)
+        cols = parse_directory_columns(data)
+        if cols is None:
+            continue
+        hits = []
+        for i in range(cols["count"]):
+            if cols["attr"][i] == ATTR_LFN or cols["first"][i] == 0xE5 or cols["attr"][i] & ATTR_DIR:
+                continue # Thư mục con đã có trong report["dirs"]
+            start = (cols["clus_hi"][i] << 16) | cols["clus_lo"][i]
+            if start >= 2 and any(c in wanted and c not in found for c in get_chain(fat, start)):
+                hits.append(i)
+        for e in build_entries(data, cols, hits):
+            claim(e["cluster"], get_chain(fat, e["cluster"]), os.path.join(path, e["name"]))
+
+    merged = []
+    for col in report["collisions"]:
+        owner, name = found.get(col["clusters"][0], (None, None))
+        c = {"clusters": list(col["clusters"]), "owner_cluster": owner, "file": col["file"],
+             "owner": name or f"<cluster {col['clusters'][0]}>"}
+        last = merged[-1] if merged else None
+        if (last and owner is not None and last["file"] == c["file"] and last["owner_cluster"] == owner
+                and last["clusters"][1] + 1 == c["clusters"][0]):
+            last["clusters"][1] = c["clusters"][1] # Hai đoạn liền nhau cùng chủ -> gộp
+        else:
+            merged.append(c)
+    return merged
+
+def write_collision_report(collisions, path=COLLISION_REPORT):
+    with open(path, "w", encoding="utf-8") as fp:
+        json.dump(collisions, fp, ensure_ascii=False, indent=2)
+
+# === QUÉT THƯ MỤC MỒ CÔI (toàn bộ vùng dữ liệu) ===
+# Thư mục con đã xóa mà entry ở thư mục cha bị ghi đè -> không đi tới được từ root.
+# Quét tuần tự mọi cluster dữ liệu theo từng khối lớn, nhận diện cluster đầu của thư mục
+# nhờ chữ ký entry "." (trỏ về chính nó) + ".." rồi dựng lại cây con bằng scan_directory.
+SWEEP_CHUNK = 32 * 1024 * 1024
+DOT_NAME = b".          "
+DOTDOT_NAME = b"..         "
+
+def is_dir_start(block, cluster):
+    """Cluster có bắt đầu bằng cặp entry '.' (cluster = chính nó) và '..' không."""
+    if len(block) < 64 or block[0:11] != DOT_NAME or block[32:43] != DOTDOT_NAME:
+        return False
+    if not (block[11] & ATTR_DIR and block[43] & ATTR_DIR):
+        return False
+    self_cluster = (struct.unpack("<H", block[20:22])[0] << 16) | struct.unpack("<H", block[26:28])[0]
+    return self_cluster == cluster
+
+def find_dir_clusters(f, bpb, lay, on_progress=None):
+    """
+    Đọc tuần tự vùng dữ liệu (mỗi lần SWEEP_CHUNK byte), trả về {cluster: cluster_cha}
+    của mọi cluster trông như đầu thư mục. Chỉ byte đầu mỗi cluster được so trước (cắt lát theo bước).
+    """
+    cluster_size = bpb["bps"] * bpb["spc"]
+    total = data_cluster_count(bpb, lay)
+    per_chunk = max(1, SWEEP_CHUNK // cluster_size)
+    data_offset = lay["data"] * bpb["bps"]
+    found = {}
+    for first in range(0, total, per_chunk):
+        n = min(per_chunk, total - first)
+        try:
+            chunk = f.read_at(data_offset + first * cluster_size, n * cluster_size)
+        except IOError:
+            continue
+        heads = chunk[0::cluster_size]
+        pos = heads.find(b".")
+        while pos != -1:
+            cluster = first + pos + 2
+            block = chunk[pos * cluster_size:pos * cluster_size + 64]
+            if is_dir_start(block, cluster):
+                found[cluster] = (struct.unpack("<H", block[52:54])[0] << 16) | struct.unpack("<H", block[58:60])[0]
+            pos = heads.find(b".", pos + 1)
+        if on_progress:
+            on_progress(min(first + n, total) * 100 // max(1, total))
+    return found
+
+def sweep_orphan_dirs(f, bpb, lay, fat, visited, emit=None, chains=None, on_progress=None, alloc=None, report=None,
+                      pool=None, budget=check.DEFAULT_BUDGET):
+    """
+    Dựng lại các cây thư mục mồ côi (không thuộc `visited` của lần duyệt từ root).
+    File trong đó có đường dẫn dạng [Orphan_<cluster>]/...
+    """
+    dir_clusters = find_dir_clusters(f, bpb, lay, on_progress)
+    orphans = [c for c in sorted(dir_clusters) if c not in visited]
+    orphan_set = set(orphans)
+    # Gốc trước (cha không phải thư mục mồ côi) -> con cháu được duyệt trong cây của gốc, không bị báo trùng
+    orphans.sort(key=lambda c: dir_clusters[c] in orphan_set)
+
+    results = []
+    for c in orphans:
+        if c in visited:
+            continue
+        results.extend(scan_directory(f, c, bpb, lay, f"[Orphan_{c}]", emit=emit, fat=fat,
+                                      chains=chains, visited=visited, alloc=alloc, report=report, pool=pool,
+                                      budget=budget))
+    return results
+
 # === MAIN (CHÍNH) ===
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python quet_nhanh_fat.py <path_to_fat32_image_or_drive>")
-        return
-
-    image_path = sys.argv[1]
+    import argparse
+    parser = argparse.ArgumentParser(description="Quét nhanh FAT12/16/32")
+    parser.add_argument("path", help="Đường dẫn image hoặc ổ đĩa FAT")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Quét thêm toàn bộ vùng dữ liệu để tìm thư mục mồ côi (chậm hơn)")
+    parser.add_argument("--offset", type=int, default=0,
+                        help="Offset (byte) của phân vùng trong ổ đĩa / image nguyên ổ")
+    parser.add_argument("--out", default=RESULT_JSONL, help="File JSON Lines ghi kết quả")
+    parser.add_argument("--collisions", default=COLLISION_REPORT, help="File báo cáo va chạm cluster")
+    parser.add_argument("--sample-kb", type=int, default=check.SAMPLE_WINDOW // 1024,
+                        help="Kích thước mỗi cửa sổ mẫu khi chấm điểm (KB), 0 = đọc nguyên file")
+    parser.add_argument("--sample-blocks", type=int, default=check.SAMPLE_BLOCKS,
+                        help="Số khối mẫu cách đều ở giữa file")
+    parser.add_argument("--full-mb", type=int, default=check.FULL_READ_MAX // (1024 * 1024),
+                        help="Ảnh / Office / PDF nhỏ hơn ngưỡng này (MB) được đọc nguyên file để phân tích đầy đủ")
+    args = parser.parse_args()
+    budget = check.make_budget(args.sample_kb, args.sample_blocks, args.full_mb)
+
+    image_path = args.path
     
     try:
-        with open(image_path, "rb") as f:
-            start_lba = 0
-            boot = read_sector(f, start_lba, 512)
+        with image_reader.open_image(image_path) as f:
+            boot = f.read_at(args.offset, 512)
             if boot[510:512] != b'\x55\xaa':
                 print("[!!!] Lỗi: Không tìm thấy chữ ký 0xAA55. Có thể không phải FAT32 hợp lệ.")
                 return
+            if boot[3:11] == b"EXFAT   ":
+                print("[!!!] Đây là exFAT -> dùng quet_nhanh_exfat.py", flush=True)
+                return
 
             bpb = parse_bpb(boot)
+            start_lba = args.offset // bpb["bps"] # Đơn vị sector của chính phân vùng
             lay = layout(start_lba, bpb)
+            fat = load_fat(f, bpb, lay)
 
             # --- Gửi tín hiệu ban đầu ---
             print("PROGRESS 0", flush=True)
 
-            # Phase 1: Đếm tổng (có thể lâu)
-            # In ra log để người dùng biết không bị treo
-            # print("[DEBUG] Đang đếm số lượng file...", flush=True) 
-            
-            try:
-                total_entries = count_entries(f, bpb["root"], bpb, lay)
-            except Exception as e:
-                total_entries = 1000 # Fallback nếu lỗi đếm
-
-            if total_entries <= 0:
-                total_entries = 1
-
-            # Init progress obj with fixed total
-            dprogress_obj = {"done": 0, "total": total_entries}
-
-            # Phase 2: Quét thực sự
-            deleted_files = scan_directory(f, bpb["root"], bpb, lay, "", dprogress_obj)
+            # --sweep: duyệt cây chiếm 0-50%, quét vùng dữ liệu 50-99%
+            def progress(lo, hi):
+                return lambda p: print(f"PROGRESS {lo + p * (hi - lo) // 100}", flush=True)
+
+            # Quét một lượt (mỗi file xóa được phát ngay ra stdout + deleted_files.jsonl)
+            # File cần chấm điểm đi qua IntegrityPool (đóng pool = chờ chấm xong trước khi đóng stream)
+            with ResultStream(args.out) as stream, IntegrityPool(image_path, budget) as pool:
+                chains = {}
+                visited = set()
+                alloc = build_alloc_map(fat)
+                report = new_report()
+                scan_directory(f, bpb["root"], bpb, lay, "", emit=stream.emit, fat=fat, chains=chains,
+                               on_progress=progress(0, 50 if args.sweep else 100), visited=visited,
+                               alloc=alloc, report=report, pool=pool)
+                if args.sweep:
+                    sweep_orphan_dirs(f, bpb, lay, fat, visited, emit=stream.emit, chains=chains,
+                                      on_progress=progress(50, 99), alloc=alloc, report=report, pool=pool)
+
+            # Báo cáo các đoạn cluster của file đã xóa đang bị file khác chiếm
+            if report["collisions"]:
+                write_collision_report(resolve_owners(f, bpb, lay, fat, chains, report), args.collisions)
+                print(f"[!] {len(report['collisions'])} đoạn cluster bị file đang dùng chiếm -> {args.collisions}", flush=True)
 
             # --- KẾT THÚC ---
             print("PROGRESS 100", flush=True)
-
-            # --- XUẤT RA JSON ---
-            try:
-                with open("deleted_files.json", "w", encoding="utf-8") as json_file:
-                    json.dump(deleted_files, json_file, indent=4, ensure_ascii=False)
-                print(f"Xong! Tìm được {len(deleted_files)} file đã xóa.", flush=True)
-            except Exception as e:
-                print(f"[ERROR] Lỗi ghi JSON: {e}", flush=True)
+            print(f"Xong! Tìm được {stream.count} file đã xóa.", flush=True)
 
     except FileNotFoundError:
         print(f"[ERROR] Không tìm thấy file: {image_path}", flush=True)
@@ -305,4 +865,4 @@ def main():
         print(f"[ERROR] Lỗi không xác định: {e}", flush=True)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
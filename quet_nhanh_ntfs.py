@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 # quet_sau_ntfs_full.py
 
-import struct, json, datetime, sys, os, check
+import struct, json, datetime, sys, os, argparse, base64, check, image_reader
+from array import array
+from result_stream import ResultStream, RESULT_JSONL
 
 # === CẤU HÌNH ===
-OUT_JSON = "deleted_files.json"
+MFT_CHUNK = 4 * 1024 * 1024 # Mỗi lần đọc $MFT ~4MB (làm tròn theo kích thước record)
+USA_STRIDE = 512            # Update Sequence Array: 2 byte cuối của mỗi 512 byte trong record
 
 # === HỖ TRỢ ===
 
@@ -37,9 +40,8 @@ def format_size(size_bytes):
 
 # === ĐỌC BOOT SECTOR ===
 
-def read_boot_sector(f):
-    f.seek(0)
-    boot = f.read(512)
+def read_boot_sector(f, part_offset=0):
+    boot = f.read_at(part_offset, 512)
     if len(boot) < 512:
         raise ValueError("Không đọc được boot sector.")
     if boot[3:11] != b"NTFS    ":
@@ -62,6 +64,7 @@ def read_boot_sector(f):
 # === PARSE DATA RUN ===
 
 def parse_data_run(content):
+    """[(lcn, số cluster), ...] theo thứ tự trong file; run thưa (sparse, không có offset) -> lcn = None."""
     pos = 0
     runs = []
     current_lcn = 0
@@ -81,17 +84,41 @@ def parse_data_run(content):
         cluster_off_raw = int.from_bytes(content[pos:pos + off_len], "little", signed=True) if off_len else 0
         pos += off_len
 
+        if not off_len:
+            runs.append((None, cluster_len)) # Run thưa: không chiếm cluster, đọc ra toàn 0
+            continue
         current_lcn += cluster_off_raw
         runs.append((current_lcn, cluster_len))
     return runs
 
 
+# === FIXUP (UPDATE SEQUENCE ARRAY) ===
+
+def apply_fixups(record):
+    """
+    Trả lại 2 byte gốc ở cuối mỗi sector của record (bytearray / memoryview ghi được, sửa tại chỗ).
+    Kiểm tra: số phần tử USA khớp kích thước record, mọi sector đều kết thúc bằng Update Sequence Number.
+    False -> record hỏng (ghi dở / bị ghi đè) không được dùng.
+    """
+    usa_off, usa_count = struct.unpack_from("<HH", record, 0x04)
+    if usa_count < 2 or (usa_count - 1) * USA_STRIDE != len(record) or usa_off + usa_count * 2 > USA_STRIDE - 2:
+        return False
+    usn = bytes(record[usa_off:usa_off + 2])
+    for i in range(1, usa_count):
+        end = i * USA_STRIDE
+        if record[end - 2:end] != usn:
+            return False
+    for i in range(1, usa_count):
+        end = i * USA_STRIDE
+        record[end - 2:end] = record[usa_off + 2 * i:usa_off + 2 * i + 2]
+    return True
+
+
 # === LẤY RUNS TỪ RECORD $MFT ===
 
 def get_mft_runs_and_size(f, mft_offset, record_size):
-    f.seek(mft_offset)
-    rec = f.read(record_size)
-    if not rec or rec[0:4] != b"FILE":
+    rec = bytearray(f.read_at(mft_offset, record_size))
+    if not rec or rec[0:4] != b"FILE" or not apply_fixups(rec):
         return None, None
 
     attr_off = struct.unpack_from("<H", rec, 0x14)[0]
@@ -122,20 +149,74 @@ def get_mft_runs_and_size(f, mft_offset, record_size):
 
 # === ĐỌC RECORD TỪ RUNS ===
 
-def read_record_from_mft_runs(f, runs, cluster_size, record_size, logical_offset):
+def mft_disk_offset(runs, cluster_size, logical_offset, part_offset=0):
+    """Offset trong $MFT -> offset tuyệt đối trên ổ / image (None nếu nằm ngoài các run)."""
     cum = 0
     for (lcn, length) in runs:
         run_bytes = length * cluster_size
         if cum <= logical_offset < cum + run_bytes:
-            inside = logical_offset - cum
-            disk_offset = lcn * cluster_size + inside
-            f.seek(disk_offset)
-            data = f.read(record_size)
-            return data if len(data) == record_size else None
+            return part_offset + lcn * cluster_size + logical_offset - cum
         cum += run_bytes
     return None
 
 
+def read_record_from_mft_runs(f, runs, cluster_size, record_size, logical_offset, part_offset=0):
+    disk_offset = mft_disk_offset(runs, cluster_size, logical_offset, part_offset)
+    if disk_offset is None:
+        return None
+    data = f.read_at(disk_offset, record_size)
+    return data if len(data) == record_size else None
+
+
+# === ĐỌC TUẦN TỰ CẢ $MFT ===
+
+def iter_mft_records(f, runs, cluster_size, record_size, part_offset=0, total_records=None, chunk_size=MFT_CHUNK,
+                     stats=None):
+    """
+    Đọc $MFT đúng một lần, tuần tự theo từng run, mỗi lần đọc một khúc lớn (chunk_size).
+    Trả về (rec_idx, memoryview của record) - không copy từng record, fixup đã được áp dụng tại chỗ.
+    Chỉ trả record có chữ ký FILE và fixup hợp lệ; record hỏng (fixup sai / chữ ký BAAD) được đếm vào
+    stats["bad"] (kèm stats["bad_records"]: vài rec_idx đầu tiên) thay vì bị bỏ qua im lặng.
+    Record nằm vắt qua ranh giới hai run được nối lại; đọc thiếu (image bị cắt) -> độn 0 để giữ đúng rec_idx.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault("bad", 0)
+    stats.setdefault("bad_records", [])
+    if total_records is None:
+        total_records = sum(length * cluster_size for (_, length) in runs) // record_size
+    chunk_size = max(record_size, chunk_size - chunk_size % record_size)
+
+    rec_idx = 0
+    carry = b""
+    for (lcn, length) in runs:
+        run_start = part_offset + lcn * cluster_size
+        run_bytes = length * cluster_size
+        pos = 0
+        while pos < run_bytes and rec_idx < total_records:
+            want = min(chunk_size, run_bytes - pos)
+            data = bytearray(carry)
+            data += f.read_at(run_start + pos, want) # bytearray: fixup sửa trực tiếp trên khúc vừa đọc
+            if len(data) < len(carry) + want:
+                data += bytes(len(carry) + want - len(data))
+            pos += want
+            view = memoryview(data)
+            count = min(len(view) // record_size, total_records - rec_idx)
+            for i in range(count):
+                record = view[i * record_size:(i + 1) * record_size]
+                magic = record[0:4]
+                if magic == b"FILE" and apply_fixups(record):
+                    yield rec_idx, record
+                elif magic == b"FILE" or magic == b"BAAD":
+                    stats["bad"] += 1
+                    if len(stats["bad_records"]) < 20:
+                        stats["bad_records"].append(rec_idx)
+                rec_idx += 1
+            carry = bytes(view[count * record_size:])
+        if rec_idx >= total_records:
+            break
+
+
 # === EXTRACT FILE_NAME ===
 
 def extract_file_name_from_record(record):
@@ -159,7 +240,7 @@ def extract_file_name_from_record(record):
 
                 parent = struct.unpack_from("<Q", content, 0)[0] & 0xFFFFFFFFFFFF
                 name_len = content[0x40]
-                name = content[0x42:0x42 + name_len * 2].decode("utf-16le", errors="ignore")
+                name = bytes(content[0x42:0x42 + name_len * 2]).decode("utf-16le", errors="ignore")
                 created = filetime_to_str(struct.unpack_from("<Q", content, 0x10)[0])
                 modified = filetime_to_str(struct.unpack_from("<Q", content, 0x18)[0])
                 accessed = filetime_to_str(struct.unpack_from("<Q", content, 0x20)[0])
@@ -174,10 +255,11 @@ def extract_file_name_from_record(record):
 
 # === DATA ATTRIBUTE ===
 
-def extract_data_info_from_record(record):
+def find_data_attribute(record):
+    """Vị trí attribute $DATA chính (không tên) trong record, None nếu không có."""
     try:
         if record[0:4] != b"FILE":
-            return None, 0
+            return None
 
         attr_off = struct.unpack_from("<H", record, 0x14)[0]
         pos = attr_off
@@ -186,65 +268,178 @@ def extract_data_info_from_record(record):
             if attr_type == 0xFFFFFFFF:
                 break
             attr_len = struct.unpack_from("<I", record, pos + 4)[0]
+            if attr_len == 0:
+                break
 
-            if attr_type == 0x80 and record[pos + 8] == 1:
-                off = struct.unpack_from("<H", record, pos + 0x20)[0]
-                real = struct.unpack_from("<Q", record, pos + 0x30)[0]
-                content = record[pos + off:pos + attr_len]
-                runs = parse_data_run(content)
-
-                if runs:
-                    return runs[0][0], real
-                return None, real
+            if attr_type == 0x80 and record[pos + 9] == 0: # name_length = 0 -> không phải stream phụ (ADS)
+                return pos
 
             pos += attr_len
     except:
         pass
-    return None, 0
+    return None
 
 
-# === XÂY DỰNG PARENT TREE ===
+def extract_data_runs_from_record(record):
+    """Toàn bộ run list của $DATA non-resident: (runs, real_size). $DATA resident / không có -> (None, 0)."""
+    pos = find_data_attribute(record)
+    if pos is None or record[pos + 8] != 1:
+        return None, 0
+    try:
+        attr_len = struct.unpack_from("<I", record, pos + 4)[0]
+        off = struct.unpack_from("<H", record, pos + 0x20)[0]
+        real = struct.unpack_from("<Q", record, pos + 0x30)[0]
+        return parse_data_run(record[pos + off:pos + attr_len]), real
+    except (struct.error, IndexError):
+        return None, 0
+
+
+def extract_resident_data_from_record(record):
+    """$DATA resident (file nhỏ nằm ngay trong record): (nội dung, vị trí trong record) hoặc (None, 0)."""
+    pos = find_data_attribute(record)
+    if pos is None or record[pos + 8] != 0:
+        return None, 0
+    try:
+        csize = struct.unpack_from("<I", record, pos + 16)[0]
+        coff = struct.unpack_from("<H", record, pos + 20)[0]
+        if pos + coff + csize > len(record):
+            return None, 0
+        return bytes(record[pos + coff:pos + coff + csize]), pos + coff
+    except (struct.error, IndexError):
+        return None, 0
 
-def build_parent_tree_from_runs(f, runs, cluster_size, record_size, max_records=None):
-    tree = {}
-    total_bytes = sum(length * cluster_size for (_, length) in runs)
-    total_records = total_bytes // record_size
 
-    for rec_idx in range(total_records):
-        logical = rec_idx * record_size
-        record = read_record_from_mft_runs(f, runs, cluster_size, record_size, logical)
-        if not record:
-            continue
-        parent, name, *_ = extract_file_name_from_record(record)
-        if name:
-            tree[rec_idx] = {"name": name, "parent": parent}
-        if max_records and rec_idx >= max_records:
-            break
+def extract_data_info_from_record(record):
+    """(cluster đầu tiên có dữ liệu, real_size) - run thưa ở đầu file được bỏ qua."""
+    runs, real = extract_data_runs_from_record(record)
+    for lcn, _ in runs or ():
+        if lcn is not None:
+            return lcn, real
+    return None, real
+
 
-    return tree, total_records
+def runs_to_extents(runs, cluster_size, part_offset=0):
+    """Run (lcn, số cluster) -> [[offset tuyệt đối, số byte], ...] dùng cho ImageReader.read_runs; run thưa -> None."""
+    return [[part_offset + lcn * cluster_size if lcn is not None else None, length * cluster_size]
+            for lcn, length in runs]
 
 
-def build_full_path(rec_no, tree):
+# === BẢNG CHA / TÊN (gọn: mảng số + một chuỗi tên chung) ===
+# parent[rec] = record cha (-1: record không có FILE_NAME), tên của rec = text[name_off[rec]:+name_len[rec]]
+
+def new_path_table(total_records):
+    return {
+        "parent": array("q", [-1]) * total_records,
+        "name_off": array("Q", [0]) * total_records,
+        "name_len": array("H", [0]) * total_records,
+        "names": [],
+        "size": 0,
+        "text": None,
+    }
+
+
+def add_path_entry(table, rec_idx, parent, name):
+    if rec_idx >= len(table["parent"]):
+        return
+    table["parent"][rec_idx] = parent
+    table["name_off"][rec_idx] = table["size"]
+    table["name_len"][rec_idx] = len(name)
+    table["names"].append(name)
+    table["size"] += len(name)
+    table["text"] = None
+
+
+def build_full_path(rec_no, table):
+    if table["text"] is None:
+        table["text"] = "".join(table["names"])
+    parent, name_off, name_len, text = table["parent"], table["name_off"], table["name_len"], table["text"]
     parts = []
     cur = rec_no
     for _ in range(100):
-        if cur not in tree:
+        if cur is None or not 0 <= cur < len(parent) or parent[cur] < 0:
             break
-        entry = tree[cur]
-        parts.insert(0, entry["name"])
-        cur = entry["parent"]
+        off = name_off[cur]
+        parts.insert(0, text[off:off + name_len[cur]])
+        cur = parent[cur]
         if cur == 5:
             break
     return "\\".join(parts)
 
 
+def path_is_final(rec_no, table, seen_upto):
+    """
+    True khi đường dẫn của rec_no không còn thay đổi: mọi record tổ tiên còn thiếu trong bảng
+    đều đã được duyệt qua (<= seen_upto) -> sẽ không bao giờ được bổ sung. Cùng điều kiện dừng với build_full_path.
+    """
+    parent = table["parent"]
+    cur = rec_no
+    for _ in range(100):
+        if cur is None or not 0 <= cur < len(parent):
+            return True
+        if parent[cur] < 0:
+            return cur <= seen_upto
+        cur = parent[cur]
+        if cur == 5:
+            return True
+    return True
+
+
 # Alias
 build_full_path_from_tree = build_full_path
 
 
+# === QUÉT $MFT MỘT LƯỢT ===
+
+def scan_mft(f, runs, cluster_size, record_size, part_offset=0, total_records=None, on_progress=None, stats=None):
+    """
+    Generator: một lượt tuần tự qua $MFT, vừa dựng bảng cha/tên cho mọi record, vừa trả về record đã xóa
+    (full_path đã ghép). Record có thư mục cha đã nằm trong bảng được trả về ngay (phần lớn, vì thư mục
+    thường có số record nhỏ hơn); record còn chờ tổ tiên ở phía sau $MFT được trả nốt khi hết lượt.
+    total_records: số record hợp lệ ($MFT real size) - record sau đó chỉ góp tên vào bảng.
+    stats: dict nhận số record hỏng (xem iter_mft_records).
+    """
+    all_records = sum(length * cluster_size for (_, length) in runs) // record_size
+    if total_records is None:
+        total_records = all_records
+    table = new_path_table(all_records)
+    pending = []
+
+    last_percent = -1
+    for rec_idx, record in iter_mft_records(f, runs, cluster_size, record_size, part_offset, stats=stats):
+        if on_progress:
+            percent = rec_idx * 100 // max(1, all_records)
+            if percent > last_percent:
+                on_progress(percent)
+                last_percent = percent
+        name_info = extract_file_name_from_record(record)
+        if not name_info[1]:
+            continue
+        add_path_entry(table, rec_idx, name_info[0], name_info[1])
+        in_use = struct.unpack_from("<H", record, 0x16)[0] & 1
+        if rec_idx < total_records and not in_use:
+            parsed = parse_mft_record_by_bytes(record, rec_idx, cluster_size, None, part_offset, name_info,
+                                               mft_disk_offset(runs, cluster_size, rec_idx * record_size, part_offset))
+            if not parsed:
+                continue
+            if path_is_final(name_info[0], table, rec_idx):
+                parsed["full_path"] = build_full_path(name_info[0], table)
+                yield parsed
+            else:
+                pending.append((name_info[0], parsed))
+
+    for parent, parsed in pending:
+        parsed["full_path"] = build_full_path(parent, table)
+        yield parsed
+
+
 # === PARSE RECORD ===
 
-def parse_mft_record_by_bytes(record, rec_idx, cluster_size, tree):
+def parse_mft_record_by_bytes(record, rec_idx, cluster_size, tree, part_offset=0, name_info=None, record_offset=None):
+    """
+    tree = None: chưa ghép full_path (scan_mft ghép khi đường dẫn đã đủ tổ tiên). name_info: FILE_NAME đã đọc sẵn.
+    $DATA resident: nội dung lấy luôn từ record (trường "resident", base64) - không cần đọc thêm đĩa;
+    offset = vị trí nội dung trên đĩa (record_offset: offset tuyệt đối của record, nếu biết).
+    """
     try:
         if record[0:4] != b"FILE":
             return None
@@ -253,18 +448,37 @@ def parse_mft_record_by_bytes(record, rec_idx, cluster_size, tree):
         if flags & 1:  # in_use = True
             return None
 
-        parent, name, created, modified, accessed = extract_file_name_from_record(record)
+        parent, name, created, modified, accessed = name_info or extract_file_name_from_record(record)
         if not name:
             return None
 
-        start_cluster, file_size = extract_data_info_from_record(record)
+        ext = os.path.splitext(name)[1].replace(".", "").lower()
+        full_path = build_full_path_from_tree(parent, tree) if tree is not None else ""
+
+        runs, file_size = extract_data_runs_from_record(record)
+        if runs is None:
+            data, data_pos = extract_resident_data_from_record(record)
+            if data is None:
+                return None
+            return {
+                "name": name,
+                "type": ext,
+                "size": len(data),
+                "created": created,
+                "modified": modified,
+                "accessed": accessed,
+                "full_path": full_path,
+                "offset": record_offset + data_pos if record_offset is not None else 0,
+                "start_cluster": None,
+                "resident": base64.b64encode(data).decode("ascii"),
+                "status": "Deleted"
+            }
+
+        start_cluster = next((lcn for lcn, _ in runs if lcn is not None), None)
         if not start_cluster:
             return None
 
-        offset = start_cluster * cluster_size
-        ext = os.path.splitext(name)[1].replace(".", "").lower()
-        full_path = build_full_path_from_tree(parent, tree)
-
+        offset = part_offset + start_cluster * cluster_size # Offset tuyệt đối trên ổ / image
         return {
             "name": name,
             "type": ext,
@@ -275,6 +489,7 @@ def parse_mft_record_by_bytes(record, rec_idx, cluster_size, tree):
             "full_path": full_path,
             "offset": offset,
             "start_cluster": start_cluster,
+            "runs": runs_to_extents(runs, cluster_size, part_offset), # File phân mảnh: đọc theo đúng thứ tự run
             "status": "Deleted"
         }
 
@@ -284,21 +499,31 @@ def parse_mft_record_by_bytes(record, rec_idx, cluster_size, tree):
 # === CHƯƠNG TRÌNH CHÍNH ===
 
 def main():
-    if len(sys.argv) < 2:
-        print("Sử dụng: python quet_nhanh_ntfs.py <đường_dẫn_ảnh_phân_vùng_NTFS>")
-        return
-
-    image_path = sys.argv[1]
-    if not os.path.exists(image_path):
+    parser = argparse.ArgumentParser(description="Quét nhanh file đã xóa trên phân vùng NTFS")
+    parser.add_argument("path", help="Đường dẫn image hoặc ổ đĩa NTFS")
+    parser.add_argument("--offset", type=int, default=0,
+                        help="Offset (byte) của phân vùng trong ổ đĩa / image nguyên ổ")
+    parser.add_argument("--out", default=RESULT_JSONL, help="File JSON Lines ghi kết quả")
+    parser.add_argument("--sample-kb", type=int, default=check.SAMPLE_WINDOW // 1024,
+                        help="Kích thước mỗi cửa sổ mẫu khi chấm điểm (KB), 0 = đọc nguyên file")
+    parser.add_argument("--sample-blocks", type=int, default=check.SAMPLE_BLOCKS,
+                        help="Số khối mẫu cách đều ở giữa file")
+    parser.add_argument("--full-mb", type=int, default=check.FULL_READ_MAX // (1024 * 1024),
+                        help="Ảnh / Office / PDF nhỏ hơn ngưỡng này (MB) được đọc nguyên file để phân tích đầy đủ")
+    args = parser.parse_args()
+    budget = check.make_budget(args.sample_kb, args.sample_blocks, args.full_mb)
+
+    image_path = args.path
+    part_offset = args.offset
+    if not image_path.startswith("\\\\.\\") and not os.path.exists(image_path):
         print("Không tìm thấy file.")
         return
 
-    results = []
-
     try:
-        with open(image_path, "rb") as f:
-            cluster_size, mft_cluster, record_size = read_boot_sector(f)
-            mft_offset = mft_cluster * cluster_size
+        # Mỗi file xóa được phát ngay: dòng `FILE {...}` ra stdout + append vào deleted_files.jsonl
+        with ResultStream(args.out) as stream, image_reader.open_image(image_path) as f:
+            cluster_size, mft_cluster, record_size = read_boot_sector(f, part_offset)
+            mft_offset = part_offset + mft_cluster * cluster_size
 
             runs, real_size = get_mft_runs_and_size(f, mft_offset, record_size)
             if not runs:
@@ -310,64 +535,45 @@ def main():
             # Gửi tín hiệu bắt đầu
             print("PROGRESS 0", flush=True)
 
-            # Bước 1: Xây dựng cây thư mục (Bước này cũng tốn thời gian, nhưng tạm thời chưa báo progress để đơn giản)
-            # Nếu muốn kỹ hơn, bạn có thể chia progress: 30% cho build tree, 70% cho parse.
-            tree, _ = build_parent_tree_from_runs(f, runs, cluster_size, record_size)
-
-            # Bước 2: Quét và Parse (Đây là bước lâu nhất)
-            for rec_idx in range(total_records):
-                
-                # --- THÊM ĐOẠN NÀY ĐỂ BÁO TIẾN ĐỘ ---
-                if rec_idx % 1000 == 0: # Cứ mỗi 1000 records thì báo 1 lần để đỡ lag
-                    if total_records > 0:
-                        percent = int((rec_idx / total_records) * 100)
-                        print(f"PROGRESS {percent}", flush=True)
-                # ------------------------------------
-
-                logical = rec_idx * record_size
-                record = read_record_from_mft_runs(f, runs, cluster_size, record_size, logical)
-                if not record:
-                    continue
-                parsed = parse_mft_record_by_bytes(record, rec_idx, cluster_size, tree)
-                if parsed:
-                    integrity_val = "Unknown"
-                    try:
-                        # Chỉ check nếu file có kích thước hợp lý (>0 và <50MB để tránh treo)
-                        f_size = parsed["size"]
-                        f_offset = parsed["offset"]
-                        f_ext = parsed["type"]
-                        
-                        if f_size > 0 and f_size < 50 * 1024 * 1024:
-                            current_pos = f.tell() # Lưu vị trí cũ
-                            f.seek(f_offset)       # Nhảy tới vị trí file
-                            raw_data = f.read(f_size) # Đọc dữ liệu lên RAM
-                            f.seek(current_pos)    # Quay lại vị trí cũ
-                            
-                            # Gọi hàm check từ bộ nhớ
-                            # Lưu ý: check.py mới phải hỗ trợ đọc bytes (như code mình đưa ở trên)
-                            score = check.analyze_file_integrity(raw_data, f_ext)
-                            integrity_val = f"{score:.2f}"
-                        elif f_size >= 50 * 1024 * 1024:
-                            integrity_val = "Skipped (Too Large)"
+            # Một lượt qua $MFT: mỗi file xóa được chấm điểm và phát ngay khi ghép xong đường dẫn
+            stats = {}
+            for parsed in scan_mft(f, runs, cluster_size, record_size, part_offset, total_records,
+                                   on_progress=lambda p: print(f"PROGRESS {min(p, 99)}", flush=True),
+                                   stats=stats):
+                integrity_val = "Unknown"
+                try:
+                    f_size = parsed["size"]
+                    f_ext = parsed["type"]
+
+                    if f_size > 0 and (budget is not None or f_size < 50 * 1024 * 1024):
+                        # Chỉ đọc các cửa sổ mẫu (header + footer + K khối) -> file lớn vẫn được chấm
+                        if "resident" in parsed:
+                            # Nội dung đã có trong record -> chấm điểm ngay trên bộ nhớ
+                            data = base64.b64decode(parsed["resident"])
+                            read_at = lambda rel, n: data[rel:rel + n]
                         else:
-                            integrity_val = "0" # File rỗng
-                            
-                    except Exception as e:
-                        integrity_val = ""
-                    
-                    # Thêm vào dict kết quả
-                    parsed["integrity"] = integrity_val
-                    # =======================
+                            extents = parsed["runs"]
+                            read_at = lambda rel, n: f.read_runs(extents, n, rel)
+                        score = check.analyze_sampled_integrity(read_at, 0, f_size, f_ext, budget)
+                        integrity_val = f"{score:.2f}"
+                    elif f_size >= 50 * 1024 * 1024:
+                        integrity_val = "Skipped (Too Large)" # --sample-kb 0: đọc nguyên file như cũ
+                    else:
+                        integrity_val = "0" # File rỗng
 
-                    results.append(parsed)
+                except Exception as e:
+                    integrity_val = ""
 
-        # Gửi tín hiệu kết thúc 100%
-        print("PROGRESS 100", flush=True)
+                parsed["integrity"] = integrity_val
+                stream.emit(parsed)
 
-        with open(OUT_JSON, "w", encoding="utf-8") as jf:
-            json.dump(results, jf, ensure_ascii=False, indent=2)
+            if stats["bad"]:
+                print(f"[!] {stats['bad']} MFT record hỏng (fixup sai / BAAD) bị bỏ qua, "
+                      f"vd. record {stats['bad_records'][:5]}", flush=True)
 
-        print(f"Xong! Tìm được {len(results)} file đã xóa.", flush=True)
+        # Gửi tín hiệu kết thúc 100%
+        print("PROGRESS 100", flush=True)
+        print(f"Xong! Tìm được {stream.count} file đã xóa ({stats['bad']} MFT record hỏng).", flush=True)
 
     except Exception as e:
         print(f"[LỖI] {e}")
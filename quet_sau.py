@@ -1,4 +1,6 @@
-import os, sys, json, io, check 
+import os, sys, json, io, re, queue, threading, check, image_reader, checkpoint, process_guard
+from bisect import bisect_left
+from result_stream import ResultStream
 from PIL import Image
 
 # ==============================
@@ -6,6 +8,12 @@ from PIL import Image
 # ==============================
 CHUNK_SIZE = 128 * 1024 * 1024     # 4 MB (thực ra là 128MB theo code gốc)
 MAX_BUFFER = 256 * 1024 * 1024    # 64 MB giữ buffer biên (thực ra là 256MB)
+KEEP_SIZE = 10 * 1024 * 1024      # Phần đuôi buffer giữ lại để nối với chunk sau
+READ_BUFFERS = 2                  # Số buffer luân phiên giữa luồng đọc và luồng so khớp
+WORKER_READ_SIZE = 32 * 1024 * 1024 # Quét song song trên ổ thật: mỗi worker đọc từng 32MB (~2 x 42MB buffer / worker)
+SCORE_QUEUE_SIZE = 64             # Số ứng viên tối đa chờ ghi/chấm điểm
+SCORER_THREADS = 2                # Số luồng ghi file + chấm điểm toàn vẹn
+CHECKPOINT_GB = 1                 # Ghi checkpoint (cho --resume) sau mỗi N GB đã quét
 OUTPUT_DIR = "recovered_files"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -13,7 +21,7 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 # 🔍 Chữ ký file (head -> tail)
 # ==============================
 SIGNATURES = {
-    "jpg":  {"head": b"\xFF\xD8", "tail": b"\xFF\xD9", "strategy": "simple", "ext":"jpg"},
+    "jpg":  {"head": b"\xFF\xD8", "tail": b"\xFF\xD9", "strategy": "jpeg", "ext":"jpg"},
     "png":  {"head": b"\x89PNG\r\n\x1a\n", "tail": b"IEND\xAE\x42\x60\x82", "strategy": "simple", "ext":"png"},
     "pdf":  {"head": b"%PDF-", "tail": b"%%EOF", "strategy": "pdf", "ext":"pdf"},
     "webp": {"head": b"RIFF", "tail": None, "strategy":"riff", "ext":"webp"},
@@ -25,6 +33,55 @@ SIGNATURES = {
 
 ALL_HEADS = [v["head"] for v in SIGNATURES.values() if v.get("head")]
 
+# ==============================
+# 🎯 Bộ so khớp header một lượt (multi-pattern)
+# ==============================
+def build_head_matcher(signatures):
+    """
+    Gom các header giống nhau (VD: PK\x03\x04 dùng chung cho docx/xlsx/pptx)
+    rồi biên dịch thành MỘT regex. Engine `re` lập sẵn bảng byte đầu tiên
+    nên buffer chỉ bị duyệt một lần, dù bảng chữ ký có bao nhiêu mục.
+    """
+    head_types = {}
+    for key, sig in signatures.items():
+        head = sig.get("head")
+        if head:
+            head_types.setdefault(head, []).append(key)
+    # Header dài thử trước để không bị header ngắn "nuốt" mất
+    heads = sorted(head_types, key=len, reverse=True)
+    pattern = re.compile(b"|".join(re.escape(h) for h in heads))
+    return pattern, head_types
+
+HEAD_PATTERN, HEAD_TYPES = build_head_matcher(SIGNATURES)
+HEADS_BY_LEN = sorted(HEAD_TYPES, key=len, reverse=True)
+# Byte đầu của mọi header -> dùng cho chế độ căn lề (chỉ xét 1 byte tại mỗi vị trí căn lề)
+HEAD_FIRST_BYTE = re.compile(b"[" + b"".join(re.escape(bytes([h[0]])) for h in HEAD_TYPES) + b"]")
+
+def find_headers(buf, start=0, end=None, align=1, base=0):
+    """
+    Trả về lần lượt (vị trí, [các loại ứng viên]) của mọi header trong buf[start:end].
+    align > 1: chỉ xét các vị trí có (base + vị trí) chia hết cho align
+    (base = offset tuyệt đối của buf[0] trừ đi gốc căn lề).
+    """
+    if end is None:
+        end = len(buf)
+    if align <= 1:
+        for m in HEAD_PATTERN.finditer(buf, start, end):
+            yield m.start(), HEAD_TYPES[m.group()]
+        return
+
+    # Cắt lát theo bước `align` (chạy bằng C) -> chỉ còn 1/align số byte cần so khớp
+    first = start + (-(base + start)) % align
+    if first >= end:
+        return
+    firsts = buf[first:end:align]
+    for m in HEAD_FIRST_BYTE.finditer(firsts):
+        pos = first + m.start() * align
+        for head in HEADS_BY_LEN:
+            if buf[pos:pos + len(head)] == head:
+                yield pos, HEAD_TYPES[head]
+                break
+
 # ==============================
 # 🧩 Hàm đọc an toàn
 # ==============================
@@ -34,6 +91,13 @@ def safe_read(f, size):
     except Exception:
         return b""
 
+def safe_readinto(f, view):
+    """Đọc thẳng vào vùng nhớ có sẵn (không tạo bytes mới). Trả về số byte đọc được."""
+    try:
+        return f.readinto(view) or 0
+    except Exception:
+        return 0
+
 # 🧠 Kiểm tra hợp lệ
 def is_valid_image(data, ftype):
     try:
@@ -71,178 +135,621 @@ def is_valid_office_zip(data, target):
         return True
     return False
 
+# ==============================
+# 🗂️ Chỉ mục footer (ghép header -> footer bằng bisect)
+# ==============================
+# Mọi footer được gom bằng MỘT lượt regex cho cả cửa sổ, lưu thành danh sách vị trí tăng dần.
+# Mỗi header chỉ còn tra bisect O(log n) thay vì buf.find() quét lại từ đầu
+# -> hàng nghìn header JPEG giả (\xFF\xD8 chỉ 2 byte) không còn làm tìm tail thành O(n^2).
+# Các footer bắt đầu bằng byte khác nhau và không tự chồng lên nhau -> finditer không bỏ sót vị trí nào.
+# (JPEG tự đi theo marker -> không cần chỉ mục FFD9)
+ALL_TAILS = sorted({sig["tail"] for sig in SIGNATURES.values()
+                    if sig.get("tail") and sig["strategy"] != "jpeg"}, key=len, reverse=True)
+TAIL_PATTERN = re.compile(b"|".join(re.escape(t) for t in ALL_TAILS))
+
+def build_tail_index(buf, start=0, end=None):
+    """Trả về {footer: [các vị trí tăng dần]} của mọi footer trong buf[start:end]."""
+    if end is None:
+        end = len(buf)
+    index = {t: [] for t in ALL_TAILS}
+    for m in TAIL_PATTERN.finditer(buf, start, end):
+        index[m.group()].append(m.start())
+    return index
+
+def next_tail(index, tail, pos):
+    """Vị trí footer đầu tiên >= pos trong chỉ mục, -1 nếu không có."""
+    positions = index[tail]
+    i = bisect_left(positions, pos)
+    return positions[i] if i < len(positions) else -1
+
 # 📏 Hàm tìm tail
-def find_tail_simple(buf, head_idx, tail):
-    idx = buf.find(tail, head_idx + len(tail))
+# `end` = số byte hợp lệ trong buf (buffer cấp phát sẵn có thể chưa đầy)
+# `index` = chỉ mục footer của cửa sổ đang quét (None -> tìm trực tiếp bằng buf.find)
+def find_tail_simple(buf, head_idx, tail, end=None, index=None):
+    if end is None: end = len(buf)
+    if index is not None:
+        idx = next_tail(index, tail, head_idx + len(tail))
+    else:
+        idx = buf.find(tail, head_idx + len(tail), end)
     return None if idx == -1 else idx + len(tail)
 
-def find_tail_pdf(buf, head_idx, tail=None):
-    idx = buf.find(b"%%EOF", head_idx)
+def find_tail_pdf(buf, head_idx, tail=None, end=None, index=None):
+    if end is None: end = len(buf)
+    if index is not None:
+        idx = next_tail(index, b"%%EOF", head_idx)
+    else:
+        idx = buf.find(b"%%EOF", head_idx, end)
     return None if idx == -1 else idx + len(b"%%EOF")
 
-def find_tail_riff(buf, head_idx, tail=None):
-    if len(buf) < head_idx + 12:
+# ==============================
+# 📷 Duyệt cấu trúc JPEG theo marker
+# ==============================
+# Thay vì lấy FFD9 gần nhất (bị cắt cụt ở thumbnail EXIF), đi lần lượt từng segment:
+# APPn/DQT/DHT/SOFn... nhảy theo trường độ dài, SOS thì lướt qua dữ liệu entropy
+# (FF00 là byte đệm, FFD0-FFD7 là RST) tới marker thật kế tiếp, cho tới EOI.
+# Chuỗi marker sai -> trả về REJECT ngay, không tốn Image.verify().
+REJECT = -1 # Ứng viên chắc chắn hỏng (khác None = chưa đủ dữ liệu)
+
+JPEG_ENTROPY_END = re.compile(b"\xFF[^\x00\xD0-\xD7\xFF]") # Marker thật đầu tiên sau dữ liệu entropy
+JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+JPEG_SEGMENTS = JPEG_SOF | set(range(0xE0, 0xF0)) | {0xC4, 0xCC, 0xDB, 0xDC, 0xDD, 0xDE, 0xDF, 0xFE}
+
+def find_tail_jpeg(buf, head_idx, tail=None, end=None, index=None):
+    if end is None: end = len(buf)
+    pos = head_idx + 2
+    seen_sof = seen_sos = False
+    while True:
+        if pos + 2 > end:
+            return None
+        if buf[pos] != 0xFF:
+            return REJECT
+        marker = buf[pos + 1]
+        if marker == 0xFF: # Byte đệm trước marker
+            pos += 1
+            continue
+        if marker == 0xD9: # EOI
+            return pos + 2 if seen_sos else REJECT
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01: # RST / TEM: không có độ dài
+            pos += 2
+            continue
+        if marker != 0xDA and marker not in JPEG_SEGMENTS:
+            return REJECT
+
+        if pos + 4 > end:
+            return None
+        length = (buf[pos + 2] << 8) | buf[pos + 3]
+        if length < 2:
+            return REJECT
+        pos += 2 + length
+        if marker in JPEG_SOF:
+            seen_sof = True
+        elif marker == 0xDA:
+            if not seen_sof:
+                return REJECT
+            seen_sos = True
+            m = JPEG_ENTROPY_END.search(buf, pos, end)
+            if m is None:
+                return None
+            pos = m.start()
+
+def find_tail_riff(buf, head_idx, tail=None, end=None, index=None):
+    if end is None: end = len(buf)
+    if end < head_idx + 12:
         return None
     size_field = int.from_bytes(buf[head_idx+4:head_idx+8], "little")
-    end = head_idx + 8 + size_field
-    return end if end < len(buf) else None
+    file_end = head_idx + 8 + size_field
+    return file_end if file_end < end else None
 
-def find_tail_zip(buf, head_idx, tail=None):
-    eocd = buf.find(b"PK\x05\x06", head_idx)
-    return None if eocd == -1 else eocd + 22
+def find_tail_zip(buf, head_idx, tail=None, end=None, index=None):
+    if end is None: end = len(buf)
+    if index is not None:
+        eocd = next_tail(index, b"PK\x05\x06", head_idx)
+    else:
+        eocd = buf.find(b"PK\x05\x06", head_idx, end)
+    return None if eocd == -1 or eocd + 22 > end else eocd + 22
 
 
 TAIL_FINDERS = {
     "simple": find_tail_simple,
+    "jpeg": find_tail_jpeg,
     "pdf": find_tail_pdf,
     "riff": find_tail_riff,
     "zip": find_tail_zip,
 }
 
+def validate_candidate(key, data):
+    """Xác thực dữ liệu đã cắt theo loại file."""
+    if key in ("jpg", "png"):
+        return is_valid_image(data, key)
+    if key == "pdf":
+        return is_valid_pdf(data)
+    if key == "webp":
+        return is_valid_webp(data)
+    if key in ("docx", "xlsx", "pptx"):
+        return is_valid_office_zip(data, key)
+    return False
+
+
+def scan_window(buf, head_start, head_end, valid, next_pos, can_stall=True, align=1, base=0):
+    """
+    Tìm header trong buf[head_start:head_end], tail được phép nằm tới buf[:valid].
+    Trả về lần lượt (key, start_rel, end_rel, data) của các ứng viên hợp lệ.
+      - next_pos[key]: sau khi cắt thành công 1 file thì bỏ qua các header cùng loại nằm bên trong nó
+      - can_stall: chưa thấy tail -> ngừng tìm loại đó, chờ chunk sau (chế độ đọc tuần tự)
+      - align/base: chỉ nhận header tại vị trí căn lề (xem find_headers)
+    """
+    stalled = set()
+    tail_index = None # Lập khi gặp header đầu tiên (cửa sổ không có header thì khỏi quét footer)
+    for start_rel, keys in find_headers(buf, head_start, head_end, align, base):
+        if tail_index is None:
+            tail_index = build_tail_index(buf, head_start, valid)
+        for key in keys:
+            if key in stalled or start_rel < next_pos.get(key, 0):
+                continue
+            sig = SIGNATURES[key]
+
+            # Tìm tail (tra chỉ mục footer)
+            end_rel = TAIL_FINDERS[sig["strategy"]](buf, start_rel, sig.get("tail"), valid, tail_index)
+
+            # Cấu trúc sai -> bỏ hẳn header này (không chờ thêm dữ liệu)
+            if end_rel == REJECT:
+                continue
+
+            # Nếu không tìm thấy tail, hoặc file quá lớn vượt buffer -> bỏ qua tạm thời
+            if end_rel is None:
+                # Buffer đã quá lớn mà vẫn chưa thấy tail -> có thể file lỗi, bỏ header này
+                # Ngược lại: chưa đủ dữ liệu, ngừng tìm loại này để đọc thêm chunk mới
+                if can_stall and valid < MAX_BUFFER:
+                    stalled.add(key)
+                continue
+
+            # Trích xuất dữ liệu
+            data = bytes(buf[start_rel:end_rel])
+
+            # Xác thực dữ liệu (Validate)
+            if not validate_candidate(key, data):
+                continue
+
+            # Cập nhật vị trí tìm kiếm tiếp theo cho loại này
+            next_pos[key] = end_rel
+            yield key, start_rel, end_rel, data
+
+
+def save_carved(key, data, abs_offset, source_path):
+    """Ghi file đã cắt ra OUTPUT_DIR, chấm điểm toàn vẹn (ngay trên bytes trong RAM) và trả về dict kết quả."""
+    sig = SIGNATURES[key]
+
+    # Xuất file
+    filename = f"{key}_{abs_offset}.{sig['ext']}" # Đặt tên theo offset để dễ debug
+    out_path = os.path.join(OUTPUT_DIR, filename)
+    with open(out_path, "wb") as out:
+        out.write(data)
+
+    # Check Integrity
+    integrity_str = "N/A"
+    try:
+        integrity_score = check.analyze_file_integrity(data, sig["ext"])
+        integrity_str = f"{integrity_score:.2f}"
+    except Exception as e:
+        integrity_str = f"Error: {e}"
+
+    # Ghi kết quả
+    entry = {
+        "name": filename,
+        "full_path": os.path.abspath(source_path),
+        "offset": abs_offset, # [CHÍNH XÁC]
+        "size": len(data),
+        "type": key,
+        "temp_path": os.path.abspath(out_path),
+        "integrity": integrity_str,
+        "status": "Carved"
+    }
+    entry["Chi tiết"] = entry.copy()
+    return entry
+
+
+def iter_carved(f, start, end, margin=KEEP_SIZE, on_progress=None, align=1, phase=0, chunk=CHUNK_SIZE):
+    """
+    Cắt file có header nằm trong [start, end) của image; tail được phép vượt quá `end` tối đa `margin` byte.
+    Trả về lần lượt (key, abs_offset, data). on_progress(vị_trí_đã_quét) được gọi sau mỗi chunk.
+    align > 1: chỉ nhận header tại offset tuyệt đối có (offset - phase) chia hết cho align.
+    chunk: số byte mỗi lần đọc ở chế độ đọc tuần tự (bộ nhớ ~ READ_BUFFERS * (KEEP_SIZE + chunk)).
+    """
+    if f.map is not None:
+        # === CHẾ ĐỘ MMAP (file image) ===
+        # Cả image là một buffer: header tìm theo từng cửa sổ CHUNK_SIZE,
+        # tail được phép vượt sang `margin` byte kế tiếp. Không copy, không đọc lại phần nối.
+        m = f.map
+        image_size = len(m)
+        end = min(end, image_size)
+        next_pos = {}
+        win_start = start
+        while win_start < end:
+            win_end = min(win_start + CHUNK_SIZE, end)
+            tail_end = min(win_end + margin, image_size)
+
+            for key, start_rel, end_rel, data in scan_window(m, win_start, win_end, tail_end, next_pos, can_stall=False,
+                                                             align=align, base=-phase):
+                yield key, start_rel, data
+
+            win_start = win_end
+            if on_progress: on_progress(win_end)
+        return
+
+    # === CHẾ ĐỘ ĐỌC TUẦN TỰ (ổ đĩa thật) ===
+    # Luồng đọc chạy riêng (read_stage), luồng hiện tại chỉ so khớp -> đĩa không phải chờ CPU.
+    free_q = queue.Queue()
+    full_q = queue.Queue()
+    for _ in range(READ_BUFFERS):
+        free_q.put(bytearray(KEEP_SIZE + chunk))
+    reader = threading.Thread(target=read_stage, args=(f, start, end + margin, free_q, full_q, chunk), daemon=True)
+    reader.start()
+
+    seen = set()   # Phần nối được quét lại ở vòng sau -> bỏ các file đã cắt (theo offset tuyệt đối)
+    while True:
+        item = full_q.get()
+        if item is None:
+            break
+        buffer, valid, buffer_start_offset = item
+        head_end = min(valid, end - buffer_start_offset)
+
+        # Quét header MỘT lượt cho mọi loại file
+        if head_end > 0:
+            for key, start_rel, end_rel, data in scan_window(buffer, 0, head_end, valid, {},
+                                                             align=align, base=buffer_start_offset - phase):
+                # [QUAN TRỌNG] Tính Offset Tuyệt Đối CHÍNH XÁC
+                abs_offset = buffer_start_offset + start_rel
+                if (key, abs_offset) in seen:
+                    continue
+                seen.add((key, abs_offset))
+                yield key, abs_offset, data
+
+        # Trả buffer cho luồng đọc
+        free_q.put(buffer)
+        if on_progress: on_progress(min(buffer_start_offset + valid, end))
+
+
+# ==============================
+# 🧵 Pipeline: đọc -> so khớp -> hàng đợi -> ghi/chấm điểm
+# ==============================
+def read_stage(f, start, stop, free_q, full_q, chunk=CHUNK_SIZE):
+    """
+    Luồng đọc: đọc tuần tự [start, stop) vào các buffer luân phiên lấy từ free_q,
+    đẩy (buffer, số_byte_hợp_lệ, offset_đầu_buffer) sang full_q, kết thúc bằng None.
+    Mỗi buffer: [KEEP_SIZE phần nối chép từ buffer trước | chunk mới đọc bằng readinto].
+    """
+    prev, prev_valid = None, 0
+    read_pos = start
+    try:
+        f.seek(start)
+        while read_pos < stop:
+            buffer = free_q.get()
+            view = memoryview(buffer)
+
+            # [CƠ CHẾ TRƯỢT BUFFER - SLIDING WINDOW]
+            # Giữ lại KEEP_SIZE byte cuối để nối với chunk sau (phòng trường hợp file nằm giữa ranh giới 2 chunk).
+            # free_q là FIFO nên buffer lấy ra luôn khác `prev` -> chép thẳng, không cấp phát mới.
+            carry = min(prev_valid, KEEP_SIZE)
+            if carry:
+                view[:carry] = memoryview(prev)[prev_valid - carry:prev_valid]
 
-def carve_unified(source_path, max_scan_gb):
+            # Đọc chunk mới thẳng vào buffer, ngay sau phần nối
+            want = min(chunk, stop - read_pos)
+            n = safe_readinto(f, view[carry:carry + want])
+            view.release()
+            if not n:
+                free_q.put(buffer)
+                break
+
+            read_pos += n
+            valid = carry + n
+            full_q.put((buffer, valid, read_pos - valid))
+            prev, prev_valid = buffer, valid
+    finally:
+        full_q.put(None)
+
+
+class ScorePool:
+    """
+    Hàng đợi có giới hạn + pool luồng ghi file / chấm điểm.
+    submit((key, abs_offset, data)); drain() chờ mọi ứng viên đã nộp xử lý xong; close() dừng pool.
+    on_result(entry) được gọi tuần tự (có khóa) ngay khi mỗi file chấm điểm xong.
+    """
+
+    def __init__(self, source_path, on_result, threads=SCORER_THREADS):
+        self.source_path = source_path
+        self.on_result = on_result
+        self.jobs = queue.Queue(maxsize=SCORE_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._scorer, daemon=True) for _ in range(max(1, threads))]
+        for t in self.threads:
+            t.start()
+
+    def _scorer(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                key, abs_offset, data = job
+                entry = save_carved(key, data, abs_offset, self.source_path)
+                with self.lock:
+                    self.on_result(entry)
+            finally:
+                self.jobs.task_done()
+
+    def submit(self, hit):
+        self.jobs.put(hit)
+
+    def drain(self):
+        self.jobs.join()
+
+    def close(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for t in self.threads:
+            t.join()
+
+
+def save_and_score_all(hits, source_path, on_result=None, threads=SCORER_THREADS):
+    """
+    Nhận (key, abs_offset, data) từ bộ so khớp, đưa qua ScorePool.
+    Có on_result: phát từng kết quả ngay khi chấm xong. Không có: trả về danh sách kết quả theo offset.
+    """
+    results = []
+    pool = ScorePool(source_path, on_result or results.append, threads)
+    try:
+        for hit in hits:
+            pool.submit(hit)
+    finally:
+        pool.close()
+
+    results.sort(key=lambda e: e["offset"])
+    return results
+
+
+# ==============================
+# 📐 Căn lề header theo sector / cluster
+# ==============================
+# File thật luôn bắt đầu ở đầu cluster -> chỉ cần thử header tại các offset căn lề.
+# Trả về (align, phase): offset hợp lệ thỏa (offset - phase) % align == 0.
+SECTOR_SIZE = 512
+
+def detect_alignment(f, part_offset=0):
+    """
+    Đọc boot sector (tại part_offset) để lấy cluster size (NTFS / FAT / exFAT); không nhận ra -> căn theo sector 512.
+    phase trả về tính theo offset tuyệt đối trên image / ổ đĩa.
+    """
+    align, phase = boot_alignment(f, part_offset)
+    return align, (part_offset + phase) % align
+
+def boot_alignment(f, part_offset):
+    try:
+        bs = f.read_at(part_offset, 512)
+    except Exception:
+        return SECTOR_SIZE, 0
+    if len(bs) < 512 or bs[510:512] != b"\x55\xAA":
+        return SECTOR_SIZE, 0
+
+    if bs[3:11] == b"EXFAT   ":
+        bps = 1 << bs[108]
+        cluster = bps << bs[109]
+        heap_offset = int.from_bytes(bs[88:92], "little") * bps
+        return cluster, heap_offset % cluster
+
+    bps = int.from_bytes(bs[11:13], "little")
+    spc = bs[13]
+    if bps not in (512, 1024, 2048, 4096) or spc == 0:
+        return SECTOR_SIZE, 0 # MBR/GPT của cả ổ đĩa -> không có cluster chung
+
+    if bs[3:11] == b"NTFS    ":
+        cluster = bps * (spc if spc <= 0x80 else 1 << (256 - spc))
+        return cluster, 0
+
+    if bs[82:87] == b"FAT32" or bs[54:59] in (b"FAT12", b"FAT16"):
+        reserved = int.from_bytes(bs[14:16], "little")
+        num_fats = bs[16]
+        root_entries = int.from_bytes(bs[17:19], "little")
+        fat_size = int.from_bytes(bs[22:24], "little") or int.from_bytes(bs[36:40], "little")
+        root_sectors = (root_entries * 32 + bps - 1) // bps
+        data_start = (reserved + num_fats * fat_size + root_sectors) * bps
+        cluster = bps * spc
+        return cluster, data_start % cluster
+
+    return SECTOR_SIZE, 0
+
+
+# ==============================
+# 🚀 Quét song song (ProcessPoolExecutor)
+# ==============================
+def carve_segment(source_path, seg_start, seg_end, align=1, phase=0):
+    """Worker: cắt một đoạn [seg_start, seg_end) của image (tail được đọc lấn sang đoạn sau KEEP_SIZE byte)."""
+    with image_reader.open_image(source_path) as f:
+        # Nhiều worker cùng đọc ổ thật -> buffer nhỏ hơn để tổng bộ nhớ không nhân theo số worker
+        hits = iter_carved(f, seg_start, seg_end, align=align, phase=phase, chunk=WORKER_READ_SIZE)
+        results = save_and_score_all(hits, source_path)
+    return seg_start, seg_end, results
+
+
+def carve_parallel(source_path, start, scan_limit, workers, on_result, on_progress, align=1, phase=0):
+    """
+    Chia image thành các đoạn CHUNK_SIZE, mỗi đoạn giao cho một process; gộp và bỏ trùng theo offset (on_result).
+    on_progress(đã_quét_bytes, đầu_liên_tục) – đầu liên tục: mọi đoạn trước vị trí này đã xong.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    seg_starts = list(range(start, scan_limit, CHUNK_SIZE))
+    done_segments = set()
+    prefix_idx = 0
+    done_bytes = start
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=process_guard.reset_child_sigterm)
+    try:
+        futures = [
+            pool.submit(carve_segment, source_path, seg_start, min(seg_start + CHUNK_SIZE, scan_limit), align, phase)
+            for seg_start in seg_starts
+        ]
+        for fut in as_completed(futures):
+            seg_start, seg_end, seg_results = fut.result()
+            for entry in seg_results:
+                on_result(entry)
+            done_bytes += seg_end - seg_start
+            done_segments.add(seg_start)
+            while prefix_idx < len(seg_starts) and seg_starts[prefix_idx] in done_segments:
+                prefix_idx += 1
+            prefix = seg_starts[prefix_idx] if prefix_idx < len(seg_starts) else scan_limit
+            on_progress(done_bytes, prefix)
+    except BaseException:
+        # Bị dừng (SIGTERM từ GUI / Ctrl+C) hoặc lỗi: hủy đoạn chưa chạy, dừng ngay các worker đang carve
+        # (shutdown thường sẽ chờ chúng quét hết đoạn). Windows: Job object của process_guard lo TerminateProcess.
+        for proc in list((pool._processes or {}).values()):
+            proc.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+
+def carve_unified(source_path, max_scan_gb, workers=1, resume=False, checkpoint_gb=CHECKPOINT_GB, align=1,
+                  part_offset=0):
+    """
+    part_offset: chỉ quét phân vùng bắt đầu tại offset này trên ổ / image nguyên ổ.
+    Giới hạn quét, tiến độ, phase căn lề và checkpoint đều tính từ đầu phân vùng; offset kết quả là tuyệt đối.
+    """
     print(f"Opening: {source_path}", flush=True)
     print("PROGRESS 0", flush=True)
-    
-    results = []
-    buffer = b""
-    
-    # [QUAN TRỌNG] Biến theo dõi tổng số byte đã đọc từ file gốc
-    total_bytes_read = 0 
-    
-    max_scan_bytes = max_scan_gb * 1024 * 1024 * 1024
+
+    # Mỗi file cắt được phát ngay: dòng `FILE {...}` ra stdout + append vào deleted_files.jsonl
+    stream = ResultStream()
+    found = []      # Kết quả tới hiện tại -> lưu vào checkpoint
+    seen = set()    # (offset, type) đã phát -> bỏ trùng khi quét lại vùng nối / các đoạn song song
+    start = part_offset
+
+    if resume:
+        cp = checkpoint.load_checkpoint(source_path, part_offset)
+        if cp:
+            max_scan_gb = cp.get("max_scan_gb", max_scan_gb)
+            start = part_offset + cp.get("carry_start", 0)
+            for entry in cp.get("results", []):
+                seen.add((entry.get("offset"), entry.get("type")))
+                found.append(entry)
+                stream.emit(entry)
+            print(f"[↻] Resume from offset {cp.get('offset', 0)} ({len(found)} files found earlier)", flush=True)
+        else:
+            print(f"[!] No checkpoint found, starting from offset {part_offset}", flush=True)
+
+    max_scan_bytes = int(max_scan_gb * 1024 * 1024 * 1024)
+    checkpoint_bytes = max(CHUNK_SIZE, int(checkpoint_gb * 1024 * 1024 * 1024))
     last_percent = -1
 
+    def report_progress(pos):
+        nonlocal last_percent
+        if max_scan_bytes > 0:
+            percent = int(((pos - part_offset) / max_scan_bytes) * 100)
+            if percent > 100: percent = 100
+            if percent > last_percent:
+                print(f"PROGRESS {percent}", flush=True)
+                last_percent = percent
+
+    def save(pos, carry_start):
+        checkpoint.save_checkpoint(source_path, max_scan_gb, pos - part_offset, carry_start - part_offset, found,
+                                   part_offset)
+
+    def on_result(entry):
+        k = (entry["offset"], entry["type"])
+        if k in seen:
+            return
+        seen.add(k)
+        found.append(entry)
+        stream.emit(entry)
+
+    completed = False
     try:
-        with open(source_path, "rb") as f:
-            while True:
-                # Kiểm tra giới hạn quét
-                if total_bytes_read >= max_scan_bytes:
-                    break
-
-                # Đọc chunk mới
-                chunk = safe_read(f, CHUNK_SIZE)
-                if not chunk:
-                    break
-                
-                buffer += chunk
-                total_bytes_read += len(chunk)
-
-                # [QUAN TRỌNG] Tính offset của đầu buffer hiện tại
-                # Buffer hiện tại bắt đầu tại vị trí: Tổng đã đọc - Độ dài buffer hiện có
-                buffer_start_offset = total_bytes_read - len(buffer)
-
-                # Duyệt qua các loại file cần tìm
-                for key, sig in SIGNATURES.items():
-                    search_pos = 0 # Vị trí tìm kiếm tương đối trong buffer
-                    
-                    while True:
-                        # Tìm header
-                        start_rel = buffer.find(sig["head"], search_pos)
-                        if start_rel == -1:
-                            break
-
-                        # [QUAN TRỌNG] Tính Offset Tuyệt Đối CHÍNH XÁC
-                        abs_offset = buffer_start_offset + start_rel
-
-                        # Tìm tail
-                        end_rel = TAIL_FINDERS[sig["strategy"]](buffer, start_rel, sig.get("tail"))
-                        
-                        # Nếu không tìm thấy tail, hoặc file quá lớn vượt buffer -> bỏ qua tạm thời
-                        if end_rel is None:
-                            # Nếu buffer đã quá lớn mà vẫn chưa thấy tail, có thể file lỗi hoặc quá to
-                            # Ta skip header này để tránh vòng lặp vô tận
-                            if len(buffer) >= MAX_BUFFER:
-                                search_pos = start_rel + 1 
-                                continue
-                            else:
-                                # Chưa đủ dữ liệu, thoát vòng lặp tìm kiếm để đọc thêm chunk mới
-                                break
-                        
-                        # Trích xuất dữ liệu
-                        data = buffer[start_rel:end_rel]
-
-                        # [Logic Kiểm tra trùng lặp offset nếu cần thiết]
-                        # (Bạn có thể thêm logic check seen_ranges ở đây nếu muốn)
-
-                        # Xác thực dữ liệu (Validate)
-                        ok = False
-                        if key in ("jpg", "png"):
-                            ok = is_valid_image(data, key)
-                        elif key == "pdf":
-                            ok = is_valid_pdf(data)
-                        elif key == "webp":
-                            ok = is_valid_webp(data)
-                        elif key in ("docx", "xlsx", "pptx"):
-                            ok = is_valid_office_zip(data, key)
-
-                        if ok:
-                            # Xuất file
-                            filename = f"{key}_{abs_offset}.{sig['ext']}" # Đặt tên theo offset để dễ debug
-                            out_path = os.path.join(OUTPUT_DIR, filename)
-                            with open(out_path, "wb") as out:
-                                out.write(data)
-
-                            # Check Integrity
-                            integrity_str = "N/A"
-                            try:
-                                integrity_score = check.analyze_file_integrity(out_path)
-                                integrity_str = f"{integrity_score:.2f}"
-                            except Exception as e:
-                                integrity_str = f"Error: {e}"
-
-                            # Ghi kết quả
-                            entry = {
-                                "name": filename,
-                                "full_path": os.path.abspath(source_path),
-                                "offset": abs_offset, # [CHÍNH XÁC]
-                                "size": len(data),
-                                "type": key,
-                                "temp_path": os.path.abspath(out_path),
-                                "integrity": integrity_str,
-                                "status": "Carved"
-                            }
-                            entry["Chi tiết"] = entry.copy()
-                            results.append(entry)
-                            
-                            # Cập nhật vị trí tìm kiếm tiếp theo
-                            search_pos = end_rel
-                        else:
-                            # Nếu không valid, tìm tiếp từ ngay sau header
-                            search_pos = start_rel + 1
-
-                # [CƠ CHẾ TRƯỢT BUFFER - SLIDING WINDOW]
-                # Giữ lại một phần cuối buffer để nối với chunk sau (phòng trường hợp file nằm giữa ranh giới 2 chunk)
-                # Kích thước giữ lại nên lớn hơn kích thước file lớn nhất kỳ vọng (ví dụ 10MB) 
-                # hoặc đơn giản là giữ lại một phần của MAX_BUFFER.
-                
-                KEEP_SIZE = 10 * 1024 * 1024 # Giữ lại 10MB cuối
-                if len(buffer) > KEEP_SIZE:
-                     buffer = buffer[-KEEP_SIZE:]
-                
-                # Cập nhật Progress
-                if max_scan_bytes > 0:
-                    percent = int((total_bytes_read / max_scan_bytes) * 100)
-                    if percent > 100: percent = 100
-                    if percent > last_percent:
-                        print(f"PROGRESS {percent}", flush=True)
-                        last_percent = percent
+        with image_reader.open_image(source_path) as f:
+            # Ổ đĩa thật thường không báo được kích thước -> dùng giới hạn quét
+            image_size = f.size()
+            scan_end = part_offset + max_scan_bytes
+            scan_limit = min(image_size, scan_end) if image_size > 0 else scan_end
+
+            # Căn lề: "auto" -> lấy cluster size từ boot sector; số cố định -> tính từ đầu phân vùng
+            if align == "auto":
+                align, phase = detect_alignment(f, part_offset)
+            else:
+                phase = part_offset % align
+            if align > 1:
+                print(f"[i] Aligned scan: {align} bytes (phase {phase})", flush=True)
+
+            # Checkpoint ngay từ đầu -> bị dừng sớm vẫn hiện trong danh sách "quét dở dang"
+            save(start, start)
+            next_checkpoint = start + checkpoint_bytes
+
+            if workers > 1:
+                def on_segment_done(done_bytes, prefix):
+                    nonlocal next_checkpoint
+                    report_progress(done_bytes)
+                    # Các đoạn song song độc lập (tail đã đọc lấn sang đoạn sau) -> không có vùng nối
+                    if prefix >= next_checkpoint:
+                        save(prefix, prefix)
+                        next_checkpoint = prefix + checkpoint_bytes
+
+                carve_parallel(source_path, start, scan_limit, workers, on_result, on_segment_done, align, phase)
+            else:
+                pool = ScorePool(source_path, on_result)
+
+                def on_chunk_done(pos):
+                    nonlocal next_checkpoint
+                    report_progress(pos)
+                    if pos >= next_checkpoint:
+                        # Chờ các file trước `pos` ghi/chấm điểm xong rồi mới chốt checkpoint
+                        pool.drain()
+                        # Đọc tuần tự: header trong KEEP_SIZE byte cuối có thể chưa thấy tail -> quét lại khi resume
+                        carry_start = pos if f.map is not None else max(start, pos - KEEP_SIZE)
+                        save(pos, carry_start)
+                        next_checkpoint = pos + checkpoint_bytes
+
+                try:
+                    for hit in iter_carved(f, start, scan_limit, on_progress=on_chunk_done, align=align, phase=phase):
+                        pool.submit(hit)
+                finally:
+                    pool.close()
+        completed = True
 
     except Exception as e:
         print(f"[❌] Error: {e}", flush=True)
+    finally:
+        stream.close()
+
+    # Quét trọn vẹn -> xóa checkpoint; lỗi giữa chừng -> giữ lại để --resume
+    if completed:
+        checkpoint.clear_checkpoint(source_path, part_offset)
 
-    # Xuất JSON kết quả
-    output_json = "deleted_files.json"
-    with open(output_json, "w", encoding="utf-8") as jf:
-        json.dump(results, jf, indent=2, ensure_ascii=False)
-    
     print("PROGRESS 100", flush=True)
-    print(f"[✅] Done. Found {len(results)} files.", flush=True)
+    print(f"[✅] Done. Found {stream.count} files.", flush=True)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python quet_sau.py <path> [GB]")
-    else:
-        drive = sys.argv[1]
-        size = float(sys.argv[2]) if len(sys.argv) > 2 else 2
-        carve_unified(drive, max_scan_gb=size)
\ No newline at end of file
+    import argparse
+
+    def align_arg(value):
+        """--align: 'auto' hoặc số byte dương là lũy thừa của 2 (1, 512, 4096, ...)."""
+        if value == "auto":
+            return value
+        try:
+            align = int(value)
+        except ValueError:
+            align = 0
+        if align <= 0 or align & (align - 1):
+            raise argparse.ArgumentTypeError(f"phải là 'auto' hoặc lũy thừa dương của 2, không phải {value!r}")
+        return align
+
+    parser = argparse.ArgumentParser(description="Quét sâu (file carving)")
+    parser.add_argument("path", help="Đường dẫn image hoặc ổ đĩa")
+    parser.add_argument("gb", nargs="?", type=float, default=2, help="Giới hạn quét (GB)")
+    parser.add_argument("--workers", "-w", type=int, default=1, help="Số process quét song song (mặc định 1)")
+    parser.add_argument("--resume", action="store_true", help="Tiếp tục từ checkpoint của lần quét trước")
+    parser.add_argument("--checkpoint-gb", type=float, default=CHECKPOINT_GB, help="Ghi checkpoint sau mỗi N GB")
+    parser.add_argument("--offset", type=int, default=0,
+                        help="Offset (byte) của phân vùng cần quét trong ổ đĩa / image nguyên ổ")
+    parser.add_argument("--align", type=align_arg, default=1,
+                        help="Chỉ thử header tại offset căn lề: số byte (VD 512), 'auto' = cluster size từ boot sector, 1 = mọi offset (mặc định, bắt được cả file nhúng)")
+    args = parser.parse_args()
+    process_guard.guard_children() # Worker của --workers không sống sót khi GUI dừng quét
+    carve_unified(args.path, max_scan_gb=args.gb, workers=max(1, args.workers),
+                  resume=args.resume, checkpoint_gb=args.checkpoint_gb, align=args.align, part_offset=max(0, args.offset))
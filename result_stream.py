@@ -0,0 +1,77 @@
+# result_stream.py
+"""
+LUỒNG KẾT QUẢ DẠNG JSON LINES (dùng chung cho quet_sau / quet_nhanh_fat / quet_nhanh_ntfs)
+Chức năng:
+  - Mỗi file tìm thấy được phát NGAY LẬP TỨC:
+      + 1 dòng `FILE {...}` ra stdout -> ScanWorker (GUI) đưa vào bảng trong lúc quét.
+      + 1 dòng JSON append vào deleted_files.jsonl -> script bị dừng/crash vẫn giữ được kết quả.
+  - load_results(): đọc lại kết quả (ưu tiên .jsonl, fallback deleted_files.json kiểu cũ).
+"""
+
+import os
+import json
+import threading
+
+RESULT_JSONL = "deleted_files.jsonl"
+LEGACY_JSON = "deleted_files.json"
+FILE_PREFIX = "FILE "
+
+
+class ResultStream:
+    def __init__(self, path=RESULT_JSONL, append=False, to_stdout=True):
+        self.path = path
+        self.to_stdout = to_stdout
+        self.count = 0
+        self.lock = threading.Lock()
+        self.fp = open(path, "a" if append else "w", encoding="utf-8")
+
+    def emit(self, entry):
+        with self.lock:
+            if self.to_stdout:
+                # stdout dùng ensure_ascii để không phụ thuộc bảng mã console của Windows
+                print(FILE_PREFIX + json.dumps(entry, ensure_ascii=True), flush=True)
+            self.fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.fp.flush()
+            self.count += 1
+
+    def close(self):
+        if not self.fp.closed:
+            self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_file_line(text):
+    """Trả về dict nếu dòng stdout là `FILE {...}`, ngược lại None."""
+    if not text.startswith(FILE_PREFIX):
+        return None
+    try:
+        return json.loads(text[len(FILE_PREFIX):])
+    except ValueError:
+        return None
+
+
+def load_results(base_dir=""):
+    jsonl_path = os.path.join(base_dir, RESULT_JSONL)
+    if os.path.exists(jsonl_path):
+        results = []
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    results.append(json.loads(line))
+                except ValueError:
+                    pass # Dòng cuối bị cắt ngang do crash -> bỏ qua
+        return results
+
+    json_path = os.path.join(base_dir, LEGACY_JSON)
+    if os.path.exists(json_path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return []